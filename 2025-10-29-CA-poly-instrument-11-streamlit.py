@@ -11,147 +11,20 @@ Características:
 """
 
 import streamlit as st
-import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
 import io
 import base64
-import tempfile
-import os
-import time
-from pathlib import Path
-import random
 import subprocess
-import json
+from collections import Counter
 
-# Music21 para geração de partituras
-from music21 import (
-    note, stream, metadata, duration, clef, instrument,
-    tempo, meter, converter
-)
-
-
-
-# ==================== GERAÇÃO MANUAL DE LILYPOND (SEM INSTALAÇÃO) ====================
-
-def note_to_lilypond(n):
-    """Converte uma nota Music21 para formato Lilypond"""
-    if isinstance(n, note.Rest):
-        duration_map = {
-            4.0: 'r1', 2.0: 'r2', 1.0: 'r4', 0.5: 'r8', 0.25: 'r16',
-        }
-        return duration_map.get(n.quarterLength, 'r4')
-    
-    elif isinstance(n, note.Note):
-        pitch_name = n.pitch.name.lower().replace('#', 'is').replace('-', 'es')
-        
-        octave = n.pitch.octave
-        if octave >= 4:
-            octave_mark = "'" * (octave - 3)
-        elif octave == 3:
-            octave_mark = ""
-        else:
-            octave_mark = "," * (3 - octave)
-        
-        duration_map = {
-            4.0: '1', 2.0: '2', 1.0: '4', 0.5: '8', 0.25: '16',
-        }
-        duration_str = duration_map.get(n.quarterLength, '4')
-        
-        return f"{pitch_name}{octave_mark}{duration_str}"
-    
-    return ""
-
-
-def instrument_to_lilypond_name(instrument_name):
-    """Converte nome do instrumento Music21 para nome Lilypond"""
-    instrument_map = {
-        'Flute': 'Flauta', 'Oboe': 'Oboé', 'Clarinet': 'Clarinete',
-        'Bassoon': 'Fagote', 'Horn': 'Trompa', 'Trumpet': 'Trompete',
-        'Trombone': 'Trombone', 'Tuba': 'Tuba', 'Violin': 'Violino',
-        'Viola': 'Viola', 'Violoncello': 'Violoncelo', 'Contrabass': 'Contrabaixo'
-    }
-    return instrument_map.get(instrument_name, instrument_name)
-
-
-def score_to_lilypond_manual(score):
-    """Gera código Lilypond manualmente SEM PRECISAR DO LILYPOND INSTALADO"""
-    try:
-        title = score.metadata.title if score.metadata and score.metadata.title else "Composição CA"
-        composer = score.metadata.composer if score.metadata and score.metadata.composer else "Compositor"
-        
-        lily_code = f'''\\version "2.24.0"
-
-\\header {{
-  title = "{title}"
-  composer = "{composer}"
-  tagline = "Gerado por Compositor CA"
-}}
-
-'''
-        
-        if score.parts:
-            first_part = score.parts[0]
-            tempo_mark = first_part.flatten().getElementsByClass('MetronomeMark')
-            time_sig = first_part.flatten().getElementsByClass('TimeSignature')
-            
-            tempo_bpm = tempo_mark[0].number if tempo_mark else 120
-            
-            if time_sig:
-                ts = time_sig[0]
-                time_str = f"{ts.numerator}/{ts.denominator}"
-            else:
-                time_str = "4/4"
-        else:
-            tempo_bpm = 120
-            time_str = "4/4"
-        
-        if len(score.parts) > 1:
-            lily_code += "\\score {\n  <<\n"
-        
-        for part_idx, part in enumerate(score.parts):
-            instrument_obj = part.getInstrument()
-            instrument_name = instrument_to_lilypond_name(instrument_obj.instrumentName) if instrument_obj else f"Instrumento {part_idx + 1}"
-            part_name = part.partName if hasattr(part, 'partName') else instrument_name
-            
-            notes_in_part = [n for n in part.flatten().notes if isinstance(n, note.Note)]
-            if notes_in_part:
-                avg_midi = sum(n.pitch.midi for n in notes_in_part) / len(notes_in_part)
-                clef = "bass" if avg_midi < 60 else "treble"
-            else:
-                clef = "treble"
-            
-            lily_code += f'''    \\new Staff \\with {{
-      instrumentName = "{part_name}"
-    }} {{
-      \\clef {clef}
-      \\time {time_str}
-      \\tempo 4 = {tempo_bpm}
-      
-'''
-            
-            lily_notes = []
-            for element in part.flatten().notes:
-                lily_note = note_to_lilypond(element)
-                if lily_note:
-                    lily_notes.append(lily_note)
-            
-            for i in range(0, len(lily_notes), 8):
-                line_notes = lily_notes[i:i+8]
-                lily_code += "      " + " ".join(line_notes) + "\n"
-            
-            lily_code += "    }\n"
-        
-        if len(score.parts) > 1:
-            lily_code += "  >>\n  \\layout { }\n  \\midi { }\n}\n"
-        else:
-            lily_code += "\\layout { }\n\\midi { }\n"
-        
-        return lily_code
-        
-    except Exception as e:
-        st.error(f"Erro ao gerar Lilypond manualmente: {str(e)}")
-        return None
+# Motor de autômatos celulares compartilhado (com cache de resultados)
+from ca_cache import generate_ca_cached, generate_ca_batch_cached
+from ca_rules import RULE_TYPES, generate_rule_matrix, rule_type_id
+from ca_expr import ExpressionError, compile_expression
+from ca_music import iter_prepared_parts, resolve_seed, rhythm_generators, reorder_notes
+from ca_exports import export_all, export_artifact, score_fingerprint
+from ca_project import PROJECT_EXTENSION, load_project, project_bytes
 
 
 def create_hacklily_iframe(lilypond_code, height=600):
@@ -201,7 +74,15 @@ RHYTHMIC_VALUES = {
     "Semibreve (1/1)": 4.0
 }
 
-RANDOM_DURATIONS = [0.5, 1.0, 2.0, 4.0]
+# Agrupamento de células repetidas em notas/pausas sustentadas
+MERGE_OPTIONS = {
+    "Não agrupar": None,
+    "Agrupar por geração": 'row',
+    "Agrupar sequência inteira": 'stream'
+}
+
+# Nomes exibidos dos formatos de exportação
+EXPORT_LABELS = {'musicxml': "MusicXML", 'midi': "MIDI", 'lilypond': "Lilypond", 'png': "PNG"}
 
 INSTRUMENTS_PT = {
     "Flauta": "Flute", "Oboé": "Oboe", "Clarinete": "Clarinet",
@@ -239,149 +120,29 @@ if 'instrument_configs' not in st.session_state:
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 'Instrumentos'
 
-if 'generated_score' not in st.session_state:
-    st.session_state.generated_score = None
-
 if 'ca_figures' not in st.session_state:
     st.session_state.ca_figures = {}
 
+if 'score_data' not in st.session_state:
+    st.session_state.score_data = None
+
 if 'midi_data' not in st.session_state:
     st.session_state.midi_data = None
 
+if 'export_timings' not in st.session_state:
+    st.session_state.export_timings = {}
+
 if 'lilypond_code' not in st.session_state:
     st.session_state.lilypond_code = None
 
-# ==================== FUNÇÕES AUXILIARES ====================
-
-def reorder_notes(initial_note, octaves, octave_mode):
-    """Reordena as notas começando pela nota inicial"""
-    notes = NOTES.copy()
-    start_index = notes.index(initial_note)
-    reordered = notes[start_index:] + notes[:start_index]
-    
-    note_list = [f"{note}{octaves[i % len(octaves)]}" for i, note in enumerate(reordered)]
-    return note_list
-
-
-def generate_rule_matrix(num_states, rule_type, **kwargs):
-    """Gera a matriz de regras"""
-    if rule_type == "Determinística":
-        return np.array([[((i + j) % num_states) for j in range(num_states)] 
-                        for i in range(num_states)])
-    
-    elif rule_type == "Thresholds":
-        thresholds = sorted(kwargs.get('thresholds', [3, 6]))
-        rule_matrix = np.zeros((num_states, num_states), dtype=int)
-        
-        for i in range(num_states):
-            for j in range(num_states):
-                for t_index, threshold in enumerate(thresholds):
-                    if j < threshold:
-                        rule_matrix[i, j] = (i + (t_index + 1)) % num_states
-                        break
-                else:
-                    rule_matrix[i, j] = 0
-        return rule_matrix
-    
-    elif rule_type == "Aleatória":
-        return np.random.randint(0, num_states, size=(num_states, num_states), dtype=int)
-    
-    elif rule_type == "Matemática":
-        math_func_str = kwargs.get('math_function', '(state + neighbor_sum) % num_states')
-        try:
-            math_function = eval(f"lambda state, neighbor_sum, num_states: {math_func_str}")
-        except:
-            math_function = lambda state, neighbor_sum, num_states: (state + neighbor_sum) % num_states
-        
-        rule_matrix = np.zeros((num_states, num_states), dtype=int)
-        for i in range(num_states):
-            for j in range(num_states):
-                try:
-                    rule_matrix[i, j] = math_function(i, j, num_states) % num_states
-                except:
-                    rule_matrix[i, j] = (i + j) % num_states
-        return rule_matrix
-    
-    elif rule_type == "Time-Sensitive":
-        time_step = kwargs.get('time_step', 1)
-        return np.array([[(i + j + time_step) % num_states for j in range(num_states)] 
-                        for i in range(num_states)])
-    
-    return np.zeros((num_states, num_states), dtype=int)
-
-
-def generate_ca(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell):
-    """Gera o autômato celular"""
-    ca = np.zeros((generations, length), dtype=int)
-    ca[0, initial_cell] = 1
-    
-    for gen in range(1, generations):
-        for i in range(length):
-            neighbor_sum = 0
-            for offset in range(-neighborhood_size, neighborhood_size + 1):
-                if offset != 0:
-                    neighbor_index = (i + offset) % length
-                    neighbor_sum += ca[gen - 1, neighbor_index]
-            
-            current_state = ca[gen - 1, i]
-            ca[gen, i] = rule_matrix[current_state, neighbor_sum % num_states]
-    
-    return ca
-
-
-def ca_to_music21(ca, num_states, rhythmic_value, randomize_rhythm, 
-                  note_list, selected_instrument, time_signature='4/4'):
-    """Converte CA em partitura"""
-    s = stream.Part()
-    s.insert(0, clef.TrebleClef())
-    s.insert(0, getattr(instrument, selected_instrument)())
-    
-    # Parse time signature
-    numerator, denominator = map(int, time_signature.split('/'))
-    beats_per_measure = numerator * (4.0 / denominator)
-    
-    if randomize_rhythm:
-        current_beat = 0.0
-        
-        for row in ca:
-            for cell in row:
-                available_durations = [d for d in RANDOM_DURATIONS 
-                                      if d <= (beats_per_measure - current_beat)]
-                
-                if not available_durations:
-                    current_beat = 0.0
-                    available_durations = RANDOM_DURATIONS.copy()
-                
-                duration_value = random.choice(available_durations)
-                
-                if cell > 0:
-                    pitch = note_list[(cell - 1) % len(note_list)]
-                    new_note = note.Note(pitch)
-                    new_note.quarterLength = duration_value
-                    s.append(new_note)
-                else:
-                    new_rest = note.Rest()
-                    new_rest.quarterLength = duration_value
-                    s.append(new_rest)
-                
-                current_beat += duration_value
-                if current_beat >= beats_per_measure:
-                    current_beat = 0.0
-    else:
-        for row in ca:
-            for cell in row:
-                if cell > 0:
-                    pitch = note_list[(cell - 1) % len(note_list)]
-                    new_note = note.Note(pitch)
-                    new_note.quarterLength = rhythmic_value
-                    s.append(new_note)
-                else:
-                    new_rest = note.Rest()
-                    new_rest.quarterLength = rhythmic_value
-                    s.append(new_rest)
-    
-    return s
+if 'project_settings' not in st.session_state:
+    st.session_state.project_settings = {}  # Configurações globais do projeto aberto
+if 'loaded_project' not in st.session_state:
+    st.session_state.loaded_project = None
+if 'project_download' not in st.session_state:
+    st.session_state.project_download = None  # (grids, configurações, bytes) do último .caproj montado
 
+# ==================== FUNÇÕES AUXILIARES ====================
 
 def visualize_ca(ca_result, instrument_name):
     """Cria visualização do CA"""
@@ -410,79 +171,78 @@ def fig_to_bytes(fig):
     return buf.getvalue()
 
 
-def score_to_lilypond(score):
+def score_to_musicxml_bytes(score_data):
     """
-    Converte partitura para código Lilypond
-    USA GERAÇÃO MANUAL - NÃO PRECISA DO LILYPOND INSTALADO!
+    Converte partitura para bytes MusicXML, compasso a compasso direto dos
+    grids, uma vez por partitura (cache de exportação), sem arquivo temporário.
     """
-    try:
-        # Gerar código manualmente
-        lilypond_code = score_to_lilypond_manual(score)
-        
-        # Validar
-        if lilypond_code and len(lilypond_code.strip()) > 0:
-            st.success(f"✅ Código Lilypond gerado: {len(lilypond_code)} caracteres")
-            return lilypond_code
-        else:
-            st.error("❌ Erro: Código Lilypond vazio")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ Erro ao gerar Lilypond: {str(e)}")
-        st.info(f"💡 Verifique se a partitura está válida")
-        return None
+    return export_artifact(score_data, 'musicxml')
 
 
-def score_to_midi_bytes(score):
-    """Converte partitura para bytes MIDI com tratamento robusto e debug"""
-    try:
-        # Criar arquivo temporário
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mid', mode='wb')
-        temp_filename = temp_file.name
-        temp_file.close()
-        
-        # Escrever MIDI
-        score.write('midi', fp=temp_filename)
-        
-        # Aguardar escrita completar
-        time.sleep(0.2)
-        
-        # Verificar se arquivo foi criado
-        if not os.path.exists(temp_filename):
-            st.error("❌ Erro: Arquivo MIDI não foi criado")
-            return None
-        
-        # Ler bytes
-        with open(temp_filename, 'rb') as f:
-            midi_bytes = f.read()
-        
-        # Verificar se tem conteúdo
-        if len(midi_bytes) == 0:
-            st.error("❌ Erro: Arquivo MIDI está vazio")
-            return None
-        
-        # Tentar deletar (com retry)
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                os.unlink(temp_filename)
-                break
-            except (PermissionError, OSError):
-                if attempt < max_retries - 1:
-                    time.sleep(0.3)
-                else:
-                    pass
-        
-        return midi_bytes
-        
-    except Exception as e:
-        st.error(f"❌ Erro ao gerar MIDI: {str(e)}")
+def open_project(instrument_configs, settings):
+    """Substitui a sessão pelo projeto aberto (grids mapeados, sem regenerar)"""
+    # Projetos da versão desktop guardam o número da regra
+    for config in instrument_configs.values():
+        config['rule_type'] = RULE_TYPES[rule_type_id(config.get('rule_type')) or 1]
+    
+    st.session_state.instrument_configs = instrument_configs
+    st.session_state.score_data = None
+    st.session_state.midi_data = None
+    st.session_state.lilypond_code = None
+    st.session_state.export_timings = {}
+    st.session_state.ca_figures = {}
+    
+    # Quantidades da página de instrumentos coerentes com o projeto
+    counts = Counter(config['base_instrument'] for config in instrument_configs.values())
+    for instruments in CATEGORIES.values():
+        for inst in instruments:
+            st.session_state[f"qty_{inst}"] = counts.get(inst, 0)
+    
+    settings = dict(settings)
+    if 'tempo' in settings:
+        # Projetos antigos da versão desktop podem trazer o texto do campo
         try:
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
-        except:
-            pass
-        return None
+            tempo = int(settings['tempo'])
+        except (TypeError, ValueError):
+            tempo = 120
+        settings['tempo'] = min(max(tempo, 40), 240)
+    st.session_state.project_settings = settings
+
+
+def current_project_settings():
+    """Configurações globais a salvar: as da última partitura gerada, se houver"""
+    settings = dict(st.session_state.project_settings)
+    data = st.session_state.score_data
+    if data:
+        settings.update(
+            title=data['title'],
+            composer=data['composer'],
+            tempo=data['tempo'],
+            time_signature=data['time_signature'],
+            seed=settings.get('seed') or str(data['seed']),
+        )
+    return settings
+
+
+def project_download_bytes(settings):
+    """
+    Bytes do projeto para o botão de download, montados de novo só quando
+    algum grid (por identidade; os grids são somente leitura) ou alguma
+    configuração muda - não a cada rerun
+    """
+    configs = st.session_state.instrument_configs
+    grids = [config.get('ca_result') for config in configs.values()]
+    meta = repr(([(name, {k: v for k, v in config.items() if k != 'ca_result'})
+                  for name, config in configs.items()], settings))
+    
+    cached = st.session_state.project_download
+    if (cached is not None and cached[1] == meta and len(cached[0]) == len(grids)
+            and all(a is b for a, b in zip(cached[0], grids))):
+        return cached[2]
+    
+    data = project_bytes(configs, settings)
+    st.session_state.project_download = (grids, meta, data)
+    return data
 
 
 def create_hacklily_url(lilypond_code):
@@ -515,37 +275,10 @@ def create_midi_player_html(midi_bytes):
     return html
 
 
-def render_lilypond_to_png(lilypond_code):
-    """Renderiza Lilypond para PNG (requer lilypond instalado) - Windows safe"""
+def render_score_png(score_data):
+    """Renderiza a partitura em PNG com Lilypond (requer lilypond instalado), uma vez por partitura"""
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            ly_file = os.path.join(tmpdir, 'score.ly')
-            
-            # Escrever arquivo Lilypond
-            with open(ly_file, 'w', encoding='utf-8') as f:
-                f.write(lilypond_code)
-            
-            # Garantir que arquivo foi escrito
-            time.sleep(0.1)
-            
-            # Executar lilypond
-            result = subprocess.run(
-                ['lilypond', '--png', '-o', tmpdir, ly_file],
-                capture_output=True,
-                timeout=30,
-                text=True
-            )
-            
-            # Esperar processamento completar
-            time.sleep(0.2)
-            
-            # Procurar PNG gerado
-            png_files = list(Path(tmpdir).glob('*.png'))
-            if png_files:
-                with open(png_files[0], 'rb') as f:
-                    png_data = f.read()
-                return png_data
-            
+        return export_artifact(score_data, 'png')
     except FileNotFoundError:
         # Lilypond não instalado
         return None
@@ -555,8 +288,6 @@ def render_lilypond_to_png(lilypond_code):
     except Exception as e:
         # Outro erro
         return None
-    
-    return None
 
 
 # ==================== INTERFACE STREAMLIT ====================
@@ -590,6 +321,30 @@ def main():
                 icon = "✅" if has_ca else "⚠️"
                 st.markdown(f"{icon} {inst}")
         
+        st.markdown("---")
+        st.markdown("### 💾 Projeto")
+        
+        uploaded = st.file_uploader("Abrir projeto", type=[PROJECT_EXTENSION.lstrip('.')])
+        if uploaded is not None and st.session_state.loaded_project != (uploaded.name, uploaded.size):
+            try:
+                instrument_configs, settings = load_project(uploaded)
+            except ValueError as e:
+                st.error(f"❌ Erro ao abrir projeto: {e}")
+            else:
+                open_project(instrument_configs, settings)
+                st.session_state.loaded_project = (uploaded.name, uploaded.size)
+                st.rerun()
+        
+        if st.session_state.instrument_configs:
+            settings = current_project_settings()
+            st.download_button(
+                label="💾 Salvar projeto",
+                data=project_download_bytes(settings),
+                file_name=f"{(settings.get('title') or 'projeto').replace(' ', '_')}{PROJECT_EXTENSION}",
+                mime="application/zip",
+                use_container_width=True
+            )
+        
         st.markdown("---")
         st.markdown("**Versão Web 1.0**")
         st.markdown("Desenvolvido com Streamlit")
@@ -628,7 +383,6 @@ def page_instruments():
                     "Quantidade",
                     min_value=0,
                     max_value=4,
-                    value=0,
                     key=f"qty_{inst}"
                 )
                 
@@ -647,6 +401,7 @@ def page_instruments():
                             'octaves': [4],
                             'rhythmic_value': 1.0,
                             'randomize_rhythm': False,
+                            'merge_runs': None,
                             'num_states': 8,
                             'generations': 20,
                             'length': 50,
@@ -741,6 +496,15 @@ def page_configuration():
             "🎲 Randomizar durações (respeitando compassos)",
             value=config.get('randomize_rhythm', False)
         )
+        
+        merge_labels = list(MERGE_OPTIONS.keys())
+        merge_key = st.selectbox(
+            "Células repetidas",
+            merge_labels,
+            index=list(MERGE_OPTIONS.values()).index(config.get('merge_runs')),
+            help="Agrupa estados repetidos em notas/pausas sustentadas (ligadas nas barras de compasso)"
+        )
+        config['merge_runs'] = MERGE_OPTIONS[merge_key]
     
     # TAB 2: Parâmetros do CA
     with tab2:
@@ -766,7 +530,7 @@ def page_configuration():
             config['length'] = st.slider(
                 "Comprimento (largura espacial)",
                 min_value=20,
-                max_value=150,
+                max_value=1000,
                 value=config.get('length', 50)
             )
         
@@ -774,7 +538,7 @@ def page_configuration():
             config['neighborhood_size'] = st.slider(
                 "Tamanho da Vizinhança",
                 min_value=1,
-                max_value=5,
+                max_value=30,
                 value=config.get('neighborhood_size', 1)
             )
             
@@ -811,6 +575,10 @@ def page_configuration():
                 value="(state + neighbor_sum) % num_states",
                 help="Variáveis: state, neighbor_sum, num_states"
             )
+            try:
+                compile_expression(config['rule_params']['math_function'])
+            except ExpressionError as e:
+                st.error(f"❌ Função inválida: {e}")
         
         elif config['rule_type'] == "Time-Sensitive":
             config['rule_params']['time_step'] = st.number_input(
@@ -819,6 +587,14 @@ def page_configuration():
                 max_value=10,
                 value=1
             )
+            
+            config['rule_params']['time_rate'] = st.number_input(
+                "Variação por geração",
+                min_value=0,
+                max_value=11,
+                value=config['rule_params'].get('time_rate', 0),
+                help="0 = regra fixa; N > 0 soma N ao deslocamento a cada geração"
+            )
     
     st.markdown("---")
     
@@ -833,14 +609,18 @@ def page_configuration():
         if st.button("🎨 Gerar CA", use_container_width=True):
             with st.spinner("Gerando autômato celular..."):
                 # Gerar matriz de regras
-                rule_matrix = generate_rule_matrix(
-                    config['num_states'],
-                    config['rule_type'],
-                    **config['rule_params']
-                )
+                try:
+                    rule_matrix = generate_rule_matrix(
+                        config['num_states'],
+                        config['rule_type'],
+                        **config['rule_params']
+                    )
+                except ExpressionError as e:
+                    st.error(f"❌ Erro na regra: {e}")
+                    st.stop()
                 
                 # Gerar CA
-                ca_result = generate_ca(
+                ca_result = generate_ca_cached(
                     rule_matrix,
                     config['generations'],
                     config['length'],
@@ -898,31 +678,31 @@ def page_visualization():
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        total = len(st.session_state.instrument_configs)
-        
-        for idx, (inst, config) in enumerate(st.session_state.instrument_configs.items()):
-            status_text.text(f"Gerando CA para {inst}...")
+        configs = st.session_state.instrument_configs
+        total = len(configs)
+
+        # Gerar matrizes de regras e evoluir todos os CAs juntos
+        status_text.text(f"Gerando {total} CA(s) em lote...")
+        try:
+            jobs = [
+                {**config, 'rule_matrix': generate_rule_matrix(
+                    config['num_states'],
+                    config['rule_type'],
+                    **config['rule_params']
+                )}
+                for config in configs.values()
+            ]
+        except ExpressionError as e:
+            st.error(f"❌ Erro na regra: {e}")
+            st.stop()
+        ca_results = generate_ca_batch_cached(jobs)
+
+        for idx, ((inst, config), ca_result) in enumerate(zip(configs.items(), ca_results)):
+            status_text.text(f"Visualizando CA de {inst}...")
             progress_bar.progress((idx + 1) / total)
-            
-            # Gerar matriz de regras
-            rule_matrix = generate_rule_matrix(
-                config['num_states'],
-                config['rule_type'],
-                **config['rule_params']
-            )
-            
-            # Gerar CA
-            ca_result = generate_ca(
-                rule_matrix,
-                config['generations'],
-                config['length'],
-                config['num_states'],
-                config['neighborhood_size'],
-                config['initial_cell']
-            )
-            
+
             config['ca_result'] = ca_result
-            
+
             # Criar visualização
             fig = visualize_ca(ca_result, inst)
             st.session_state.ca_figures[inst] = fig
@@ -982,104 +762,133 @@ def page_score():
     # Configurações globais da partitura
     st.subheader("⚙️ Configurações Globais")
     
+    # Valores iniciais do projeto aberto, se houver
+    settings = st.session_state.project_settings
+    meters = ["2/4", "3/4", "4/4", "5/4", "6/8", "9/8", "12/8"]
+    meter_str = settings.get('time_signature', "4/4")
+    
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        score_title = st.text_input("Título", value="Composição CA")
+        score_title = st.text_input("Título", value=settings.get('title', "Composição CA"))
     
     with col2:
-        composer = st.text_input("Compositor", value="Algoritmo")
+        composer = st.text_input("Compositor", value=settings.get('composer', "Algoritmo"))
     
     with col3:
-        tempo_bpm = st.number_input("Tempo (BPM)", min_value=40, max_value=240, value=120)
+        tempo_bpm = st.number_input("Tempo (BPM)", min_value=40, max_value=240, value=settings.get('tempo', 120))
     
     with col4:
-        time_sig = st.selectbox("Compasso", ["2/4", "3/4", "4/4", "5/4", "6/8", "9/8", "12/8"], index=2)
+        time_sig = st.selectbox("Compasso", meters, index=meters.index(meter_str) if meter_str in meters else 2)
+    
+    seed_text = st.text_input(
+        "Semente do ritmo",
+        value=str(settings.get('seed') or ""),
+        help="Mesma semente, mesmo ritmo aleatório. Vazio = nova semente a cada geração"
+    )
     
     st.markdown("---")
     
     # Botão de geração
     if st.button("🎼 GERAR PARTITURA", type="primary", use_container_width=True):
+        # Mesma semente, mesmo ritmo (um gerador por parte)
+        try:
+            seed = resolve_seed(seed_text.strip())
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        
         with st.spinner("Gerando partitura..."):
-            # Criar partitura
-            score = stream.Score()
-            
-            # Metadados
-            score.metadata = metadata.Metadata()
-            score.metadata.title = score_title
-            score.metadata.composer = composer
-            
             progress_bar = st.progress(0)
             status_text = st.empty()
             
             total_instruments = len(st.session_state.instrument_configs)
+            rhythm_rngs = rhythm_generators(seed, total_instruments)
+            score_parts = []
             
+            # Durações e agrupamento direto dos grids (em processos separados
+            # nas partituras grandes); as exportações (ca_exports) gravam
+            # MusicXML/MIDI/Lilypond a partir daqui, sem partitura music21
+            jobs = []
             for idx, (inst_name, config) in enumerate(st.session_state.instrument_configs.items()):
-                status_text.text(f"Processando {inst_name}... ({idx+1}/{total_instruments})")
+                jobs.append({
+                    'ca': config['ca_result'],
+                    'note_list': reorder_notes(
+                        config['initial_note'],
+                        config['octaves'],
+                        config['octave_mode']
+                    ),
+                    'instrument': INSTRUMENTS_PT[config['base_instrument']],
+                    'name': inst_name,
+                    'rhythmic_value': config['rhythmic_value'],
+                    'randomize_rhythm': config['randomize_rhythm'],
+                    'merge_runs': config.get('merge_runs'),
+                    'time_signature': time_sig,
+                    'rng': rhythm_rngs[idx],
+                })
+            
+            # Partes recebidas na ordem, à medida que ficam prontas
+            for idx, prepared in enumerate(iter_prepared_parts(jobs)):
+                status_text.text(f"Preparado {prepared['name']} ({idx+1}/{total_instruments})")
                 progress_bar.progress((idx + 1) / total_instruments)
-                
-                # Reordenar notas
-                note_list = reorder_notes(
-                    config['initial_note'],
-                    config['octaves'],
-                    config['octave_mode']
-                )
-                
-                # Converter CA para música
-                part = ca_to_music21(
-                    config['ca_result'],
-                    config['num_states'],
-                    config['rhythmic_value'],
-                    config['randomize_rhythm'],
-                    note_list,
-                    INSTRUMENTS_PT[config['base_instrument']],
-                    time_sig
-                )
-                
-                # Adicionar metadados
-                part.partName = inst_name
-                part.insert(0, tempo.MetronomeMark(number=tempo_bpm))
-                part.insert(0, meter.TimeSignature(time_sig))
-                
-                score.append(part)
+                score_parts.append(prepared)
             
             # Armazenar partitura
-            st.session_state.generated_score = score
+            st.session_state.score_data = {
+                'title': score_title,
+                'composer': composer,
+                'tempo': tempo_bpm,
+                'time_signature': time_sig,
+                'seed': seed,
+                'parts': score_parts,
+            }
+            # Chave do cache de exportação (MusicXML, MIDI, Lilypond e PNG)
+            st.session_state.score_data['fingerprint'] = score_fingerprint(st.session_state.score_data)
             
-            # Gerar MIDI
-            st.session_state.midi_data = score_to_midi_bytes(score)
+            # MIDI, Lilypond e MusicXML de uma vez, em paralelo (uma falha não afeta os outros)
+            status_text.text("Exportando formatos...")
+            exports = export_all(st.session_state.score_data, ('midi', 'lilypond', 'musicxml'))
+            st.session_state.export_timings = {fmt: result['seconds'] for fmt, result in exports.items()}
+            for fmt, result in exports.items():
+                if result['error'] is not None:
+                    st.error(f"❌ Erro ao gerar {EXPORT_LABELS[fmt]}: {result['error']}")
+            if exports['lilypond']['error'] is not None:
+                st.session_state.lilypond_error = str(exports['lilypond']['error'])
             
-            # Gerar Lilypond
-            st.session_state.lilypond_code = score_to_lilypond(score)
+            st.session_state.midi_data = exports['midi']['data']
+            st.session_state.lilypond_code = exports['lilypond']['data']
             
             status_text.text("✅ Partitura gerada com sucesso!")
-            st.success("🎉 Partitura pronta!")
+            st.success(f"🎉 Partitura pronta! (semente do ritmo: {seed})")
+            st.caption("⏱️ Exportação: " + " · ".join(
+                f"{EXPORT_LABELS[fmt]} {seconds * 1000:.0f} ms"
+                for fmt, seconds in st.session_state.export_timings.items()
+            ))
     
     # Se partitura foi gerada, mostrar opções
-    if st.session_state.generated_score:
+    if st.session_state.score_data:
         st.markdown("---")
         st.subheader("📊 Informações da Partitura")
         
-        score = st.session_state.generated_score
+        score_data = st.session_state.score_data
         
         # Estatísticas
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            st.markdown(f"**Título:** {score.metadata.title}")
-            st.markdown(f"**Compositor:** {score.metadata.composer}")
-            st.markdown(f"**Instrumentos:** {len(score.parts)}")
+            st.markdown(f"**Título:** {score_data['title']}")
+            st.markdown(f"**Compositor:** {score_data['composer']}")
+            st.markdown(f"**Instrumentos:** {len(score_data['parts'])}")
             
-            for part in score.parts:
-                num_notes = len([n for n in part.flatten().notes if isinstance(n, note.Note)])
-                num_rests = len([n for n in part.flatten().notes if isinstance(n, note.Rest)])
-                st.markdown(f"• **{part.partName}**: {num_notes} notas, {num_rests} pausas")
+            # Resumo calculado na conversão (ca_music.part_stats)
+            part_stats = [part['stats'] for part in score_data['parts']]
+            for part, stats in zip(score_data['parts'], part_stats):
+                extent = f" ({stats['lowest']}–{stats['highest']})" if stats['notes'] else ""
+                st.markdown(f"• **{part['name']}**: {stats['notes']} notas, {stats['rests']} pausas{extent}")
         
         with col2:
-            st.metric("Total de Notas", sum(len([n for n in p.flatten().notes if isinstance(n, note.Note)]) 
-                                            for p in score.parts))
-            st.metric("Total de Pausas", sum(len([n for n in p.flatten().notes if isinstance(n, note.Rest)]) 
-                                             for p in score.parts))
+            st.metric("Total de Notas", sum(stats['notes'] for stats in part_stats))
+            st.metric("Total de Pausas", sum(stats['rests'] for stats in part_stats))
         
         st.markdown("---")
         
@@ -1131,27 +940,7 @@ def page_score():
             
             # Gerar MusicXML com tratamento robusto
             try:
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.musicxml', mode='w', encoding='utf-8')
-                temp_filename = temp_file.name
-                temp_file.close()
-                
-                score.write('musicxml', fp=temp_filename)
-                time.sleep(0.1)
-                
-                with open(temp_filename, 'rb') as f:
-                    musicxml_data = f.read()
-                
-                # Tentar deletar com retry
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        os.unlink(temp_filename)
-                        break
-                    except PermissionError:
-                        if attempt < max_retries - 1:
-                            time.sleep(0.2)
-                        else:
-                            pass
+                musicxml_data = score_to_musicxml_bytes(st.session_state.score_data)
                 
                 st.download_button(
                     label="📥 Baixar MusicXML",
@@ -1191,7 +980,7 @@ def page_score():
                 # Renderizar PNG (opcional)
                 if st.button("🖼️ Renderizar Partitura (PNG)", help="Requer Lilypond instalado no sistema"):
                     with st.spinner("Renderizando com Lilypond..."):
-                        png_data = render_lilypond_to_png(st.session_state.lilypond_code)
+                        png_data = render_score_png(st.session_state.score_data)
                         
                         if png_data:
                             st.image(png_data, caption="Partitura renderizada")
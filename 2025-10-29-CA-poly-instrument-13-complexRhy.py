@@ -1,7 +1,6 @@
 import customtkinter as ctk
 from tkinter import ttk, Canvas, messagebox, filedialog
 from PIL import Image, ImageTk
-import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.colors import ListedColormap
@@ -9,10 +8,18 @@ import subprocess
 import os
 import tempfile
 from pathlib import Path
-from music21 import note, stream, metadata, duration, clef, instrument, converter, tempo, meter
-import random
 import threading
 import time
+from collections import Counter
+
+from ca_cache import generate_ca_cached, generate_ca_batch_cached
+from ca_rules import generate_rule_matrix, rule_type_id
+from ca_expr import compile_expression
+from ca_music import iter_prepared_parts, resolve_seed, rhythm_generators, reorder_notes
+from ca_midi import write_midi
+from ca_musicxml import write_musicxml
+from ca_exports import FILE_EXTENSIONS, iter_exports, score_fingerprint
+from ca_project import PROJECT_EXTENSION, load_project, save_project
 
 # Configurações do customtkinter
 ctk.set_appearance_mode("dark")
@@ -34,8 +41,12 @@ RHYTHMIC_VALUES = {
     "Semibreve (1/1)": 4.0
 }
 
-# Durações válidas para modo aleatório (sem quiálteras)
-RANDOM_DURATIONS = [0.5, 1.0, 2.0, 4.0]  # Colcheia, Semínima, Mínima, Semibreve
+# Agrupamento de células repetidas em notas/pausas sustentadas
+MERGE_OPTIONS = {
+    "Não agrupar": None,
+    "Agrupar por geração": 'row',
+    "Agrupar sequência inteira": 'stream'
+}
 
 # Durações com quiálteras (apenas para uso explícito)
 VALID_DURATIONS_WITH_TRIPLETS = {
@@ -81,7 +92,7 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         self.instrument_configs = {}
         self.current_instrument = None
         self.ca_result = None
-        self.score = None
+        self.score_data = None  # Grids e durações de cada parte (exportação direta)
         self.musescore_path = None
         self.ca_figures = {}  # NOVO: Armazenar figuras dos CAs para exportação
         
@@ -213,6 +224,24 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         )
         confirm_btn.pack(pady=30)
         
+        # Projeto: configurações + grids num único arquivo
+        project_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        project_frame.pack(pady=(0, 30))
+        
+        ctk.CTkButton(
+            project_frame,
+            text="📂 Abrir Projeto",
+            command=self.open_project,
+            height=40
+        ).pack(side="left", padx=10)
+        
+        ctk.CTkButton(
+            project_frame,
+            text="💾 Salvar Projeto",
+            command=self.save_project,
+            height=40
+        ).pack(side="left", padx=10)
+        
     def confirm_instruments(self):
         """Confirma a seleção de instrumentos e cria configurações"""
         selected = []
@@ -231,6 +260,7 @@ class CellularAutomatonMusicGUI(ctk.CTk):
                         'octaves': [4],
                         'rhythmic_value': 1.0,
                         'randomize_rhythm': False,
+                        'merge_runs': None,
                         'num_states': 8,
                         'generations': 20,
                         'length': 50,
@@ -253,6 +283,94 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         # Mudar para aba de configuração
         self.tabview.set("⚙️ Configuração Completa")
         self.update_config_instrument_list()
+    
+    def save_project(self):
+        """Salva instrumentos, grids gerados e configurações globais num arquivo .caproj"""
+        if not self.instrument_configs:
+            messagebox.showwarning("Atenção", "Nenhum instrumento configurado!")
+            return
+        
+        try:
+            tempo_bpm = int(self.tempo_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Tempo (BPM) deve ser um número inteiro")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=PROJECT_EXTENSION,
+            filetypes=[("Projeto Compositor CA", f"*{PROJECT_EXTENSION}"), ("All Files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        # Semente vazia: guarda a usada na última geração, para repetir o ritmo
+        seed = self.seed_entry.get().strip()
+        if not seed and self.score_data:
+            seed = str(self.score_data['seed'])
+        settings = {
+            'title': self.score_title_entry.get(),
+            'composer': self.composer_entry.get(),
+            'tempo': tempo_bpm,
+            'time_signature': self.meter_var.get(),
+            'seed': seed,
+        }
+        
+        try:
+            save_project(filename, self.instrument_configs, settings)
+            messagebox.showinfo("Sucesso", f"Projeto salvo em:\n{filename}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao salvar projeto:\n{e}")
+    
+    def open_project(self):
+        """Reabre um projeto .caproj; os grids são mapeados do arquivo, sem regenerar"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Projeto Compositor CA", f"*{PROJECT_EXTENSION}"), ("All Files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        try:
+            instrument_configs, settings = load_project(filename)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Erro", f"Erro ao abrir projeto:\n{e}")
+            return
+        
+        # Projetos da versão web guardam o nome da regra
+        for config in instrument_configs.values():
+            config['rule_type'] = rule_type_id(config.get('rule_type', 1)) or 1
+        
+        self.instrument_configs = instrument_configs
+        self.score_data = None
+        self.ca_figures = {}
+        
+        counts = Counter(config['base_instrument'] for config in instrument_configs.values())
+        for inst, qty_var in self.instrument_quantities.items():
+            qty_var.set(counts.get(inst, 0))
+        
+        for entry, key in ((self.score_title_entry, 'title'), (self.composer_entry, 'composer'),
+                           (self.tempo_entry, 'tempo'), (self.seed_entry, 'seed')):
+            if key in settings:
+                entry.delete(0, 'end')
+                if settings[key] not in (None, ''):
+                    entry.insert(0, str(settings[key]))
+        if settings.get('time_signature'):
+            self.meter_var.set(settings['time_signature'])
+        
+        self.update_config_instrument_list()
+        
+        # Visualizar o CA do instrumento selecionado, se já gerado
+        instrument_name = self.config_instrument_var.get()
+        ca_result = instrument_configs.get(instrument_name, {}).get('ca_result')
+        if ca_result is not None:
+            self.visualize_ca_in_frame(ca_result, instrument_name)
+            self.save_ca_btn.configure(state="normal")
+        
+        generated = sum(config['ca_result'] is not None for config in instrument_configs.values())
+        messagebox.showinfo(
+            "Projeto Aberto",
+            f"{len(instrument_configs)} instrumento(s), {generated} CA(s) gerado(s)"
+        )
+        self.tabview.set("⚙️ Configuração Completa")
         
     def build_unified_config_tab(self):
         """NOVA: Aba unificada com Configuração + Regras + Visualização"""
@@ -356,6 +474,17 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             font=ctk.CTkFont(size=12)
         ).pack(pady=10)
         
+        # Agrupar células repetidas (menos notas, ligaduras nas barras)
+        merge_frame = ctk.CTkFrame(music_panel)
+        merge_frame.pack(fill="x", padx=10, pady=5)
+        ctk.CTkLabel(merge_frame, text="Células Repetidas:").pack(anchor="w", padx=5)
+        self.merge_runs_var = ctk.StringVar(value="Não agrupar")
+        ctk.CTkOptionMenu(
+            merge_frame,
+            variable=self.merge_runs_var,
+            values=list(MERGE_OPTIONS.keys())
+        ).pack(fill="x", padx=5, pady=5)
+        
         # PAINEL 2: Parâmetros do CA
         ca_panel = ctk.CTkFrame(panels_frame)
         ca_panel.grid(row=0, column=1, padx=5, pady=5, sticky="nsew")
@@ -401,13 +530,13 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         # Comprimento
         length_frame = ctk.CTkFrame(ca_panel)
         length_frame.pack(fill="x", padx=10, pady=5)
-        ctk.CTkLabel(length_frame, text="Comprimento (20-150):").pack(anchor="w", padx=5)
+        ctk.CTkLabel(length_frame, text="Comprimento (20-1000):").pack(anchor="w", padx=5)
         self.length_var = ctk.IntVar(value=50)
         ctk.CTkSlider(
             length_frame,
             from_=20,
-            to=150,
-            number_of_steps=26,
+            to=1000,
+            number_of_steps=196,
             variable=self.length_var
         ).pack(fill="x", padx=5)
         self.length_label = ctk.CTkLabel(length_frame, text="50")
@@ -417,13 +546,13 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         # Vizinhança
         neigh_frame = ctk.CTkFrame(ca_panel)
         neigh_frame.pack(fill="x", padx=10, pady=5)
-        ctk.CTkLabel(neigh_frame, text="Tamanho Vizinhança (1-5):").pack(anchor="w", padx=5)
+        ctk.CTkLabel(neigh_frame, text="Tamanho Vizinhança (1-30):").pack(anchor="w", padx=5)
         self.neighborhood_var = ctk.IntVar(value=1)
         ctk.CTkSlider(
             neigh_frame,
             from_=1,
-            to=5,
-            number_of_steps=4,
+            to=30,
+            number_of_steps=29,
             variable=self.neighborhood_var
         ).pack(fill="x", padx=5)
         self.neigh_label = ctk.CTkLabel(neigh_frame, text="1")
@@ -485,6 +614,14 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             font=ctk.CTkFont(size=14, weight="bold")
         ).pack(side="left", padx=10, expand=True, fill="x")
         
+        ctk.CTkButton(
+            action_frame,
+            text="🔄 Gerar Todos os CAs",
+            command=self.generate_all_cas,
+            height=40,
+            font=ctk.CTkFont(size=14, weight="bold")
+        ).pack(side="left", padx=10, expand=True, fill="x")
+        
         # Frame para visualização do CA
         self.ca_viz_frame = ctk.CTkFrame(main_frame)
         self.ca_viz_frame.pack(fill="both", expand=True, padx=20, pady=10)
@@ -533,6 +670,8 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         self.rhythmic_value_var.set(rhythm_key)
         
         self.randomize_rhythm_var.set(config.get('randomize_rhythm', False))
+        merge_key = next((key for key, val in MERGE_OPTIONS.items() if val == config.get('merge_runs')), "Não agrupar")
+        self.merge_runs_var.set(merge_key)
         self.num_states_var.set(config.get('num_states', 8))
         self.generations_var.set(config.get('generations', 20))
         self.length_var.set(config.get('length', 50))
@@ -591,6 +730,16 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             self.time_step_entry = ctk.CTkEntry(self.rule_params_frame)
             self.time_step_entry.insert(0, "1")
             self.time_step_entry.pack(fill="x", padx=5, pady=5)
+            
+            ctk.CTkLabel(
+                self.rule_params_frame,
+                text="Variação por geração (0 = regra fixa):",
+                font=ctk.CTkFont(size=12)
+            ).pack(anchor="w", padx=5, pady=5)
+            
+            self.time_rate_entry = ctk.CTkEntry(self.rule_params_frame)
+            self.time_rate_entry.insert(0, "0")
+            self.time_rate_entry.pack(fill="x", padx=5, pady=5)
         else:
             ctk.CTkLabel(
                 self.rule_params_frame,
@@ -623,8 +772,10 @@ class CellularAutomatonMusicGUI(ctk.CTk):
                 rule_params['thresholds'] = [int(x.strip()) for x in self.thresholds_entry.get().split(',')]
             elif self.rule_type_var.get() == "Matemática":
                 rule_params['math_function'] = self.math_func_entry.get()
+                compile_expression(rule_params['math_function'])  # ExpressionError é um ValueError
             elif self.rule_type_var.get() == "Time-Sensitive":
                 rule_params['time_step'] = int(self.time_step_entry.get())
+                rule_params['time_rate'] = int(self.time_rate_entry.get())
             
             # Atualizar configuração
             self.instrument_configs[instrument_name].update({
@@ -633,6 +784,7 @@ class CellularAutomatonMusicGUI(ctk.CTk):
                 'octaves': octaves,
                 'rhythmic_value': rhythmic_value,
                 'randomize_rhythm': self.randomize_rhythm_var.get(),
+                'merge_runs': MERGE_OPTIONS[self.merge_runs_var.get()],
                 'num_states': self.num_states_var.get(),
                 'generations': self.generations_var.get(),
                 'length': self.length_var.get(),
@@ -668,7 +820,7 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             )
             
             # Gerar CA
-            ca_result = generate_ca(
+            ca_result = generate_ca_cached(
                 rule_matrix,
                 config['generations'],
                 config['length'],
@@ -689,6 +841,37 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao gerar CA: {e}")
     
+    def generate_all_cas(self):
+        """Gera os CAs de todos os instrumentos numa única evolução em lote"""
+        if not self.instrument_configs:
+            messagebox.showwarning("Atenção", "Nenhum instrumento configurado!")
+            return
+        
+        try:
+            jobs = [
+                {**config, 'rule_matrix': generate_rule_matrix(
+                    config['num_states'],
+                    config['rule_type'],
+                    **config['rule_params']
+                )}
+                for config in self.instrument_configs.values()
+            ]
+            ca_results = generate_ca_batch_cached(jobs)
+            
+            for config, ca_result in zip(self.instrument_configs.values(), ca_results):
+                config['ca_result'] = ca_result
+            
+            # Visualizar o instrumento selecionado
+            instrument_name = self.config_instrument_var.get()
+            if instrument_name in self.instrument_configs:
+                self.visualize_ca_in_frame(self.instrument_configs[instrument_name]['ca_result'], instrument_name)
+                self.save_ca_btn.configure(state="normal")
+            
+            messagebox.showinfo("Sucesso", f"{len(ca_results)} CA(s) gerado(s)!")
+            
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao gerar CAs: {e}")
+    
     def visualize_ca_in_frame(self, ca_result, instrument_name):
         """Visualiza o CA no frame da aba de configuração"""
         # Limpar frame anterior
@@ -805,6 +988,13 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             values=["2/4", "3/4", "4/4", "5/4", "6/8", "9/8", "12/8"]
         ).pack(side="left", padx=5)
         
+        # Semente do ritmo aleatório (vazia = nova a cada geração)
+        seed_frame = ctk.CTkFrame(config_frame)
+        seed_frame.pack(fill="x", padx=20, pady=5)
+        ctk.CTkLabel(seed_frame, text="Semente do ritmo:").pack(side="left", padx=5)
+        self.seed_entry = ctk.CTkEntry(seed_frame, width=150, placeholder_text="aleatória")
+        self.seed_entry.pack(side="left", padx=5)
+        
         # Botão de geração
         generate_frame = ctk.CTkFrame(main_frame)
         generate_frame.pack(fill="x", padx=20, pady=20)
@@ -859,6 +1049,14 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             state="disabled"
         )
         self.open_musescore_btn.pack(side="left", padx=10, expand=True, fill="x")
+        
+        self.export_all_btn = ctk.CTkButton(
+            export_frame,
+            text="📦 Exportar Todos",
+            command=self.export_all_formats,
+            state="disabled"
+        )
+        self.export_all_btn.pack(side="left", padx=10, expand=True, fill="x")
     
     def generate_score_optimized(self):
         """OTIMIZADO: Geração de partitura com feedback de progresso"""
@@ -879,91 +1077,98 @@ class CellularAutomatonMusicGUI(ctk.CTk):
             )
             return
         
+        # Campos lidos aqui: o Tk só pode ser tocado pela thread principal
+        try:
+            tempo_bpm = int(self.tempo_entry.get())
+            seed = resolve_seed(self.seed_entry.get().strip())
+        except ValueError as e:
+            messagebox.showerror("Erro", f"Configuração inválida:\n{e}")
+            return
+        title = self.score_title_entry.get()
+        composer = self.composer_entry.get()
+        meter_str = self.meter_var.get()
+        configs = list(self.instrument_configs.items())
+        
         # Desabilitar botão durante geração
         self.generate_score_btn.configure(state="disabled")
         self.progress_bar.set(0)
         self.progress_label.configure(text="Iniciando geração...")
         
-        # Thread para não travar a interface
+        def set_progress(value, text):
+            self.progress_bar.set(value)
+            self.progress_label.configure(text=text)
+        
+        # Thread para não travar a interface; toda mudança na tela passa por self.after
         def generate_thread():
             try:
                 start_time = time.time()
                 
-                # Criar partitura
-                self.progress_label.configure(text="Criando estrutura da partitura...")
-                self.progress_bar.set(0.1)
-                self.update()
+                # Mesma semente, mesmo ritmo (um gerador por parte)
+                total_instruments = len(configs)
+                rhythm_rngs = rhythm_generators(seed, total_instruments)
+                score_parts = []
                 
-                self.score = stream.Score()
+                # Durações e agrupamento direto dos grids (em processos separados
+                # nas partituras grandes); as exportações (ca_exports) gravam
+                # MusicXML/MIDI/Lilypond a partir daqui, sem partitura music21
+                jobs = []
+                for idx, (inst_name, config) in enumerate(configs):
+                    jobs.append({
+                        'ca': config['ca_result'],
+                        'note_list': reorder_notes(
+                            config['initial_note'],
+                            config['octaves'],
+                            config['octave_mode']
+                        ),
+                        'instrument': INSTRUMENTS_PT[config['base_instrument']],
+                        'name': inst_name,
+                        'rhythmic_value': config['rhythmic_value'],
+                        'randomize_rhythm': config['randomize_rhythm'],
+                        'merge_runs': config.get('merge_runs'),
+                        'time_signature': meter_str,
+                        'rng': rhythm_rngs[idx],
+                    })
                 
-                # Metadados
-                self.score.metadata = metadata.Metadata()
-                self.score.metadata.title = self.score_title_entry.get()
-                self.score.metadata.composer = self.composer_entry.get()
+                # Partes recebidas na ordem, à medida que ficam prontas
+                for idx, prepared in enumerate(iter_prepared_parts(jobs)):
+                    self.after(0, set_progress, 0.1 + (0.8 * ((idx + 1) / total_instruments)),
+                               f"Preparado {prepared['name']} ({idx+1}/{total_instruments})")
+                    score_parts.append(prepared)
                 
-                # Tempo e compasso
-                tempo_bpm = int(self.tempo_entry.get())
-                meter_str = self.meter_var.get()
-                
-                total_instruments = len(self.instrument_configs)
+                score_data = {
+                    'title': title,
+                    'composer': composer,
+                    'tempo': tempo_bpm,
+                    'time_signature': meter_str,
+                    'seed': seed,
+                    'parts': score_parts,
+                }
+                # Chave do cache de exportação
+                score_data['fingerprint'] = score_fingerprint(score_data)
+                elapsed = time.time() - start_time
                 
-                for idx, (inst_name, config) in enumerate(self.instrument_configs.items()):
-                    progress = 0.1 + (0.7 * (idx / total_instruments))
-                    self.progress_bar.set(progress)
-                    self.progress_label.configure(text=f"Processando {inst_name}... ({idx+1}/{total_instruments})")
-                    self.update()
+                def done():
+                    self.score_data = score_data
                     
-                    # Reordenar notas
-                    note_list = reorder_notes(
-                        config['initial_note'],
-                        config['octaves'],
-                        config['octave_mode']
-                    )
+                    # Visualizar (simplificado)
+                    self.visualize_score_simple()
                     
-                    # Converter CA para música (OTIMIZADO)
-                    part = ca_to_music21_optimized(
-                        config['ca_result'],
-                        config['num_states'],
-                        config['rhythmic_value'],
-                        config['randomize_rhythm'],
-                        note_list,
-                        INSTRUMENTS_PT[config['base_instrument']],
-                        meter_str  # NOVO: passar compasso
-                    )
+                    # Habilitar botões
+                    self.export_musicxml_btn.configure(state="normal")
+                    self.export_midi_btn.configure(state="normal")
+                    self.open_musescore_btn.configure(state="normal")
+                    self.export_all_btn.configure(state="normal")
                     
-                    # Adicionar nome da parte
-                    part.partName = inst_name
-                    
-                    # Adicionar tempo e compasso no início
-                    part.insert(0, tempo.MetronomeMark(number=tempo_bpm))
-                    part.insert(0, meter.TimeSignature(meter_str))
-                    
-                    self.score.append(part)
-                
-                self.progress_label.configure(text="Renderizando visualização...")
-                self.progress_bar.set(0.9)
-                self.update()
-                
-                # Visualizar (simplificado)
-                self.visualize_score_simple()
-                
-                # Habilitar botões
-                self.export_musicxml_btn.configure(state="normal")
-                self.export_midi_btn.configure(state="normal")
-                self.open_musescore_btn.configure(state="normal")
-                
-                elapsed = time.time() - start_time
-                self.progress_bar.set(1.0)
-                self.progress_label.configure(text=f"✅ Partitura gerada em {elapsed:.1f}s!")
-                
-                messagebox.showinfo("Sucesso", f"Partitura gerada com sucesso!\nTempo: {elapsed:.1f} segundos")
+                    set_progress(1.0, f"✅ Partitura gerada em {elapsed:.1f}s! (semente {seed})")
+                    messagebox.showinfo("Sucesso", f"Partitura gerada com sucesso!\nTempo: {elapsed:.1f} segundos\nSemente do ritmo: {seed}")
+                self.after(0, done)
                 
             except Exception as e:
-                messagebox.showerror("Erro", f"Erro ao gerar partitura:\n{e}")
                 import traceback
                 traceback.print_exc()
+                self.after(0, lambda error=e: messagebox.showerror("Erro", f"Erro ao gerar partitura:\n{error}"))
             finally:
-                self.generate_score_btn.configure(state="normal")
+                self.after(0, lambda: self.generate_score_btn.configure(state="normal"))
         
         thread = threading.Thread(target=generate_thread)
         thread.start()
@@ -977,16 +1182,19 @@ class CellularAutomatonMusicGUI(ctk.CTk):
         info_text = f"""
 📊 INFORMAÇÕES DA PARTITURA
 
-Título: {self.score.metadata.title}
-Compositor: {self.score.metadata.composer}
+Título: {self.score_data['title']}
+Compositor: {self.score_data['composer']}
 
-Instrumentos: {len(self.score.parts)}
+Instrumentos: {len(self.score_data['parts'])}
 
 """
-        for part in self.score.parts:
-            num_notes = len([n for n in part.flatten().notes if isinstance(n, note.Note)])
-            num_rests = len([n for n in part.flatten().notes if isinstance(n, note.Rest)])
-            info_text += f"  • {part.partName}: {num_notes} notas, {num_rests} pausas\n"
+        # Resumo calculado na conversão (ca_music.part_stats)
+        for part in self.score_data['parts']:
+            stats = part['stats']
+            info_text += f"  • {part['name']}: {stats['notes']} notas, {stats['rests']} pausas"
+            if stats['notes']:
+                info_text += f" ({stats['lowest']}–{stats['highest']})"
+            info_text += "\n"
         
         info_text += f"\n✅ Partitura pronta para exportação!"
         
@@ -1000,7 +1208,7 @@ Instrumentos: {len(self.score.parts)}
     
     def export_musicxml(self):
         """Exporta partitura como MusicXML"""
-        if not self.score:
+        if not self.score_data:
             messagebox.showwarning("Atenção", "Gere a partitura primeiro!")
             return
         
@@ -1011,14 +1219,20 @@ Instrumentos: {len(self.score.parts)}
         
         if filename:
             try:
-                self.score.write('musicxml', fp=filename)
+                self.write_score_musicxml(filename)
                 messagebox.showinfo("Sucesso", f"MusicXML salvo em:\n{filename}")
             except Exception as e:
                 messagebox.showerror("Erro", f"Erro ao exportar:\n{e}")
     
+    def write_score_musicxml(self, filename):
+        """Grava o MusicXML compasso a compasso a partir dos grids"""
+        data = self.score_data
+        write_musicxml(filename, data['parts'], data['tempo'], data['time_signature'],
+                       data['title'], data['composer'])
+    
     def export_midi(self):
         """Exporta partitura como MIDI"""
-        if not self.score:
+        if not self.score_data:
             messagebox.showwarning("Atenção", "Gere a partitura primeiro!")
             return
         
@@ -1029,22 +1243,64 @@ Instrumentos: {len(self.score.parts)}
         
         if filename:
             try:
-                self.score.write('midi', fp=filename)
+                # Direto dos grids
+                write_midi(filename, self.score_data['parts'],
+                           self.score_data['tempo'], self.score_data['time_signature'])
                 messagebox.showinfo("Sucesso", f"MIDI salvo em:\n{filename}")
             except Exception as e:
                 messagebox.showerror("Erro", f"Erro ao exportar:\n{e}")
     
+    def export_all_formats(self):
+        """Exporta MusicXML, MIDI, Lilypond e PNG de uma vez, em paralelo e fora da interface"""
+        if not self.score_data:
+            messagebox.showwarning("Atenção", "Gere a partitura primeiro!")
+            return
+        
+        folder = filedialog.askdirectory(title="Pasta para os arquivos exportados")
+        if not folder:
+            return
+        
+        score_data = self.score_data
+        base_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in (score_data['title'] or "partitura"))
+        self.export_all_btn.configure(state="disabled")
+        self.progress_label.configure(text="Exportando todos os formatos...")
+        
+        def export_thread():
+            lines = []
+            # Cada formato é gravado assim que fica pronto; falhas não afetam os outros
+            for fmt, result in iter_exports(score_data, ('musicxml', 'midi', 'lilypond', 'png')):
+                if result['error'] is None:
+                    try:
+                        path = os.path.join(folder, base_name + FILE_EXTENSIONS[fmt])
+                        data = result['data']
+                        with open(path, 'wb') as f:
+                            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+                    except OSError as e:
+                        result['error'] = e
+                if result['error'] is None:
+                    lines.append(f"✅ {fmt}: {result['seconds'] * 1000:.0f} ms")
+                else:
+                    lines.append(f"❌ {fmt}: {result['error']}")
+            
+            def done():
+                self.export_all_btn.configure(state="normal")
+                self.progress_label.configure(text="✅ Exportação concluída")
+                messagebox.showinfo("Exportação", f"Arquivos em:\n{folder}\n\n" + "\n".join(lines))
+            self.after(0, done)
+        
+        threading.Thread(target=export_thread, daemon=True).start()
+    
     def open_musescore(self):
         """Abre a partitura no MuseScore"""
-        if not self.score:
+        if not self.score_data:
             messagebox.showwarning("Atenção", "Gere a partitura primeiro!")
             return
         
         try:
             # Salvar temporariamente
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.musicxml')
-            self.score.write('musicxml', fp=temp_file.name)
             temp_file.close()
+            self.write_score_musicxml(temp_file.name)
             
             # Tentar abrir
             if os.name == 'nt':  # Windows
@@ -1064,147 +1320,6 @@ Instrumentos: {len(self.score.parts)}
             messagebox.showerror("Erro", f"Erro ao abrir MuseScore:\n{e}")
 
 
-# Funções auxiliares otimizadas
-def reorder_notes(initial_note, octaves, octave_mode):
-    """Reordena as notas começando pela nota inicial"""
-    notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    start_index = notes.index(initial_note)
-    reordered = notes[start_index:] + notes[:start_index]
-    
-    note_list = [f"{note}{octaves[i % len(octaves)]}" for i, note in enumerate(reordered)]
-    return note_list
-
-
-def generate_rule_matrix(num_states, rule_type, **kwargs):
-    """Gera a matriz de regras baseada no tipo selecionado"""
-    if rule_type == 1:  # Determinística
-        return np.array([[((i + j) % num_states) for j in range(num_states)] for i in range(num_states)])
-    
-    elif rule_type == 2:  # Thresholds
-        thresholds = sorted(kwargs.get('thresholds', [3, 6]))
-        rule_matrix = np.zeros((num_states, num_states), dtype=int)
-        
-        for i in range(num_states):
-            for j in range(num_states):
-                for t_index, threshold in enumerate(thresholds):
-                    if j < threshold:
-                        rule_matrix[i, j] = (i + (t_index + 1)) % num_states
-                        break
-                else:
-                    rule_matrix[i, j] = 0
-        return rule_matrix
-    
-    elif rule_type == 3:  # Aleatória
-        return np.random.randint(0, num_states, size=(num_states, num_states), dtype=int)
-    
-    elif rule_type == 4:  # Matemática
-        math_func_str = kwargs.get('math_function')
-        if math_func_str:
-            try:
-                math_function = eval(f"lambda state, neighbor_sum, num_states: {math_func_str}")
-            except:
-                math_function = lambda state, neighbor_sum, num_states: (state + neighbor_sum) % num_states
-        else:
-            math_function = lambda state, neighbor_sum, num_states: (state + neighbor_sum) % num_states
-        
-        rule_matrix = np.zeros((num_states, num_states), dtype=int)
-        
-        for i in range(num_states):
-            for j in range(num_states):
-                try:
-                    rule_matrix[i, j] = math_function(i, j, num_states) % num_states
-                except:
-                    rule_matrix[i, j] = (i + j) % num_states
-        return rule_matrix
-    
-    elif rule_type == 5:  # Time-sensitive
-        time_step = kwargs.get('time_step', 1)
-        return np.array([[(i + j + time_step) % num_states for j in range(num_states)] for i in range(num_states)])
-    
-    return np.zeros((num_states, num_states), dtype=int)
-
-
-def generate_ca(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell):
-    """Gera o autômato celular - OTIMIZADO"""
-    ca = np.zeros((generations, length), dtype=int)
-    ca[0, initial_cell] = 1
-    
-    for gen in range(1, generations):
-        for i in range(length):
-            neighbor_sum = 0
-            for offset in range(-neighborhood_size, neighborhood_size + 1):
-                if offset != 0:
-                    neighbor_index = (i + offset) % length
-                    neighbor_sum += ca[gen - 1, neighbor_index]
-            
-            current_state = ca[gen - 1, i]
-            ca[gen, i] = rule_matrix[current_state, neighbor_sum % num_states]
-    
-    return ca
-
-
-def ca_to_music21_optimized(ca, num_states, rhythmic_value, randomize_rhythm, note_list, 
-                            selected_instrument, time_signature='4/4'):
-    """
-    OTIMIZADO: Converte o autômato celular em partitura com sistema rítmico inteligente
-    que respeita compassos e NÃO usa quiálteras no modo aleatório
-    """
-    s = stream.Part()
-    s.insert(0, clef.TrebleClef())
-    s.insert(0, getattr(instrument, selected_instrument)())
-    
-    # Parsear fórmula de compasso
-    numerator, denominator = map(int, time_signature.split('/'))
-    beats_per_measure = numerator * (4.0 / denominator)  # Em quarter notes
-    
-    if randomize_rhythm:
-        # NOVO: Sistema que respeita compassos
-        current_beat = 0.0
-        
-        for row in ca:
-            for cell in row:
-                # Escolher duração que caiba no compasso
-                available_durations = [d for d in RANDOM_DURATIONS if d <= (beats_per_measure - current_beat)]
-                
-                if not available_durations:
-                    # Resetar compasso
-                    current_beat = 0.0
-                    available_durations = RANDOM_DURATIONS.copy()
-                
-                duration_value = random.choice(available_durations)
-                
-                # Adicionar nota ou pausa
-                if cell > 0:
-                    pitch = note_list[(cell - 1) % len(note_list)]
-                    new_note = note.Note(pitch)
-                    new_note.quarterLength = duration_value
-                    s.append(new_note)
-                else:
-                    new_rest = note.Rest()
-                    new_rest.quarterLength = duration_value
-                    s.append(new_rest)
-                
-                # Atualizar posição no compasso
-                current_beat += duration_value
-                if current_beat >= beats_per_measure:
-                    current_beat = 0.0
-    else:
-        # Modo fixo (sem randomização)
-        for row in ca:
-            for cell in row:
-                if cell > 0:
-                    pitch = note_list[(cell - 1) % len(note_list)]
-                    new_note = note.Note(pitch)
-                    new_note.quarterLength = rhythmic_value
-                    s.append(new_note)
-                else:
-                    new_rest = note.Rest()
-                    new_rest.quarterLength = rhythmic_value
-                    s.append(new_rest)
-    
-    return s
-
-
 if __name__ == "__main__":
     app = CellularAutomatonMusicGUI()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,380 @@
+"""
+🗂️ Composição em Lote (sem interface gráfica)
+Lê especificações de composições em JSON ou TOML (arquivos ou diretórios),
+gera cada uma num pool de processos e grava MIDI/MusicXML/Lilypond/PNG com
+um `manifest.json` resumindo arquivos, sementes, tempos e erros.
+
+Uso:
+    python ca_batch.py specs/ -o saida/ -f midi musicxml png -j 4
+
+Cada arquivo traz uma composição ou uma lista em "compositions", com
+"defaults" opcionais aplicados a todas. Composição:
+
+    {
+      "id": "quarteto", "title": "...", "composer": "...",
+      "tempo": 120, "time_signature": "4/4",
+      "seed": 42,                 # ou "seeds": [1, 2, 3] (uma variante por semente)
+      "stream": false,            # true: MIDI/MusicXML gravados enquanto o CA é gerado
+      "instruments": {"Flauta": {...}, "Violino 1": {...}}
+    }
+
+Os instrumentos usam as mesmas chaves de configuração da versão desktop
+('base_instrument', 'initial_note', 'octaves', 'rhythmic_value',
+'randomize_rhythm', 'merge_runs', 'num_states', 'generations', 'length',
+'neighborhood_size', 'initial_cell', 'rule_type', 'rule_params'); o que
+faltar vem de `DEFAULT_INSTRUMENT`. 'base_instrument' aceita o nome em
+português ("Flauta") ou a classe music21 ("Flute"). Também podem ser uma
+lista de configurações com 'name'.
+
+Com a mesma semente, ritmo e regras aleatórias se repetem: os geradores são
+derivados da semente como nas interfaces.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+from ca_cache import CAResultCache, generate_ca_batch_cached
+from ca_exports import EXPORTERS, FILE_EXTENSIONS, ExportCache, export_all, score_fingerprint
+from ca_midi import write_midi
+from ca_music import prepare_part, reorder_notes, resolve_seed, rhythm_generators, stream_part
+from ca_musicxml import write_musicxml
+from ca_rules import generate_rule_matrix
+
+
+SPEC_SUFFIXES = ('.json', '.toml')
+DEFAULT_FORMATS = ('midi', 'musicxml')
+MANIFEST_NAME = 'manifest.json'
+
+INSTRUMENTS_PT = {
+    "Flauta": "Flute", "Oboé": "Oboe", "Clarinete": "Clarinet",
+    "Fagote": "Bassoon", "Trompa": "Horn", "Trompete": "Trumpet",
+    "Trombone": "Trombone", "Tuba": "Tuba", "Violino": "Violin",
+    "Viola": "Viola", "Violoncelo": "Violoncello", "Contrabaixo": "Contrabass"
+}
+
+# Mesmos padrões de um instrumento recém-adicionado na versão desktop
+DEFAULT_INSTRUMENT = {
+    'base_instrument': 'Flauta',
+    'initial_note': 'C',
+    'octave_mode': 'Crescente',
+    'octaves': [4],
+    'rhythmic_value': 1.0,
+    'randomize_rhythm': False,
+    'merge_runs': None,
+    'num_states': 8,
+    'generations': 20,
+    'length': 50,
+    'neighborhood_size': 1,
+    'initial_cell': 25,
+    'rule_type': 1,
+    'rule_params': {},
+}
+
+DEFAULT_COMPOSITION = {
+    'title': 'Composição CA',
+    'composer': 'Compositor CA',
+    'tempo': 120,
+    'time_signature': '4/4',
+}
+
+_UNSAFE_ID = re.compile(r'[^\w.-]+')
+
+
+# ==================== ESPECIFICAÇÕES ====================
+
+def _read_spec_file(path):
+    if path.suffix == '.toml':
+        if tomllib is None:
+            raise RuntimeError(f"{path}: leitura de TOML requer Python 3.11+")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def spec_files(paths):
+    """Arquivos de especificação: os informados e os .json/.toml dos diretórios"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.suffix in SPEC_SUFFIXES))
+        else:
+            files.append(path)
+    return files
+
+
+def _instrument_configs(instruments):
+    """{nome: configuração completa}, a partir de um dicionário ou de uma lista com 'name'"""
+    if isinstance(instruments, dict):
+        items = instruments.items()
+    else:
+        items = [(inst.get('name') or inst.get('base_instrument', DEFAULT_INSTRUMENT['base_instrument']), inst)
+                 for inst in instruments]
+
+    configs = {}
+    for name, inst in items:
+        if name in configs:
+            raise ValueError(f"instrumento repetido: {name!r}")
+        config = {**DEFAULT_INSTRUMENT, **{k: v for k, v in inst.items() if k != 'name'}}
+        config['instrument'] = INSTRUMENTS_PT.get(config['base_instrument'], config['base_instrument'])
+        configs[name] = config
+    return configs
+
+
+def load_compositions(paths):
+    """
+    Composições de todos os arquivos, na ordem, com 'id', 'source', 'seed'
+    e 'instruments' normalizados. "seeds" vira uma composição por semente.
+    """
+    compositions, ids = [], set()
+    for path in spec_files(paths):
+        data = _read_spec_file(path)
+        entries = data.get('compositions', [data])
+        defaults = {**DEFAULT_COMPOSITION, **data.get('defaults', {})}
+
+        for idx, entry in enumerate(entries):
+            spec = {**defaults, **entry}
+            if not spec.get('instruments'):
+                raise ValueError(f"{path}: composição {idx + 1} sem instrumentos")
+            base_id = spec.get('id') or (path.stem if len(entries) == 1 else f'{path.stem}-{idx + 1:03d}')
+            seeds = spec.pop('seeds', None)
+            variants = [(base_id, spec.get('seed'))] if seeds is None else \
+                [(f'{base_id}-seed{seed}', seed) for seed in seeds]
+
+            for comp_id, seed in variants:
+                comp_id = _UNSAFE_ID.sub('_', str(comp_id))
+                if comp_id in ids:
+                    raise ValueError(f"{path}: id de composição repetido: {comp_id!r}")
+                ids.add(comp_id)
+                compositions.append({
+                    **spec,
+                    'id': comp_id,
+                    'source': str(path),
+                    'seed': resolve_seed(seed),
+                    'instruments': _instrument_configs(spec['instruments']),
+                })
+    return compositions
+
+
+# ==================== RENDERIZAÇÃO ====================
+
+def _instrument_jobs(spec):
+    """
+    Job de cada instrumento: a configuração com nome, notas, matriz de regras
+    e gerador do ritmo. A semente gera um gerador de ritmo por parte, como
+    nas interfaces, e mais um por parte para as regras aleatórias.
+    """
+    configs = spec['instruments']
+    num_parts = len(configs)
+    rngs = rhythm_generators(spec['seed'], 2 * num_parts)
+    rhythm_rngs, rule_rngs = rngs[:num_parts], rngs[num_parts:]
+
+    return [
+        {**config,
+         'name': name,
+         'note_list': reorder_notes(config['initial_note'], config['octaves'], config['octave_mode']),
+         'rule_matrix': generate_rule_matrix(config['num_states'], config['rule_type'],
+                                             rng=rule_rng, **config['rule_params']),
+         'time_signature': spec['time_signature'],
+         'rng': rhythm_rng}
+        for (name, config), rhythm_rng, rule_rng in zip(configs.items(), rhythm_rngs, rule_rngs)
+    ]
+
+
+def _score_data(spec, parts):
+    return {
+        'title': spec['title'],
+        'composer': spec['composer'],
+        'tempo': int(spec['tempo']),
+        'time_signature': spec['time_signature'],
+        'seed': spec['seed'],
+        'parts': parts,
+    }
+
+
+def build_score_data(spec):
+    """`score_data` da composição (mesmo formato das interfaces)"""
+    jobs = _instrument_jobs(spec)
+    # Cache descartável: nada se acumula no processo entre composições
+    ca_results = generate_ca_batch_cached(jobs, cache=CAResultCache())
+    score_data = _score_data(spec, [prepare_part({**job, 'ca': ca_result})
+                                    for job, ca_result in zip(jobs, ca_results)])
+    score_data['fingerprint'] = score_fingerprint(score_data)
+    return score_data
+
+
+def _write_stream_midi(path, score_data):
+    write_midi(path, score_data['parts'], score_data['tempo'], score_data['time_signature'])
+
+
+def _write_stream_musicxml(path, score_data):
+    write_musicxml(path, score_data['parts'], score_data['tempo'], score_data['time_signature'],
+                   score_data['title'], score_data['composer'])
+
+
+# Formatos gravados bloco a bloco no modo streaming
+STREAM_WRITERS = {
+    'midi': _write_stream_midi,
+    'musicxml': _write_stream_musicxml,
+}
+
+
+def render_stream(spec, output_dir, formats=DEFAULT_FORMATS):
+    """
+    Modo streaming ("stream": true): cada formato é gravado direto no arquivo
+    enquanto `ca_engine.iter_ca` gera o CA, sem guardar os grids, então a
+    memória não cresce com o número de gerações. Devolve (partes, saídas)
+    para o manifesto.
+    """
+    score_data = _score_data(spec, [stream_part(job) for job in _instrument_jobs(spec)])
+    parts = [{'name': part['name'], 'instrument': part['instrument'], 'duration': part['quarter_length']}
+             for part in score_data['parts']]
+
+    outputs = {}
+    for fmt in formats:
+        start = time.perf_counter()
+        path = Path(output_dir) / f"{spec['id']}{FILE_EXTENSIONS[fmt]}"
+        try:
+            if fmt not in STREAM_WRITERS:
+                raise ValueError(f"formato indisponível no modo streaming: {fmt}")
+            STREAM_WRITERS[fmt](path, score_data)
+        except Exception as e:  # um formato com erro não afeta os outros
+            path.unlink(missing_ok=True)
+            outputs[fmt] = {'error': f"{type(e).__name__}: {e}",
+                            'seconds': round(time.perf_counter() - start, 4)}
+            continue
+        outputs[fmt] = {'path': path.name, 'bytes': path.stat().st_size,
+                        'seconds': round(time.perf_counter() - start, 4)}
+    return parts, outputs
+
+
+def render_composition(spec, output_dir, formats=DEFAULT_FORMATS):
+    """
+    Gera a composição e grava um arquivo por formato em `output_dir`.
+    Devolve a entrada do manifesto; falhas ficam em 'error' (da composição)
+    ou no 'error' de cada formato, sem interromper o lote.
+    """
+    start = time.perf_counter()
+    entry = {'id': spec['id'], 'source': spec['source'], 'title': spec.get('title'), 'seed': spec['seed']}
+    try:
+        if spec.get('stream'):
+            entry['parts'], entry['outputs'] = render_stream(spec, output_dir, formats)
+        else:
+            score_data = build_score_data(spec)
+            entry['fingerprint'] = score_data['fingerprint']
+            entry['parts'] = [
+                {'name': part['name'], 'instrument': part['instrument'], **part['stats']}
+                for part in score_data['parts']
+            ]
+
+            entry['outputs'] = {}
+            # Cache só desta composição (o PNG reaproveita o .ly), sem limite nem disco
+            cache = ExportCache(max_bytes=math.inf, max_entry_bytes=math.inf, max_spill_bytes=0)
+            results = export_all(score_data, formats, cache=cache)
+            for fmt, result in results.items():
+                if result['error'] is not None:
+                    entry['outputs'][fmt] = {'error': f"{type(result['error']).__name__}: {result['error']}",
+                                             'seconds': round(result['seconds'], 4)}
+                    continue
+                path = Path(output_dir) / f"{spec['id']}{FILE_EXTENSIONS[fmt]}"
+                data = result['data']
+                if isinstance(data, str):
+                    data = data.encode('utf-8')
+                path.write_bytes(data)
+                entry['outputs'][fmt] = {'path': path.name, 'bytes': len(data),
+                                             'seconds': round(result['seconds'], 4)}
+    except Exception as e:  # uma composição inválida não derruba o lote
+        entry['error'] = f"{type(e).__name__}: {e}"
+
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def iter_render(compositions, output_dir, formats=DEFAULT_FORMATS, max_workers=None):
+    """
+    Gera (índice, entrada do manifesto) à medida que cada composição termina.
+    Com uma composição ou `max_workers=1` tudo roda neste processo.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if max_workers == 1 or len(compositions) < 2:
+        for idx, spec in enumerate(compositions):
+            yield idx, render_composition(spec, output_dir, formats)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(render_composition, spec, output_dir, formats): idx
+                   for idx, spec in enumerate(compositions)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def entry_failed(entry):
+    """Composição com erro próprio ou em algum dos formatos"""
+    return 'error' in entry or any('error' in out for out in entry.get('outputs', {}).values())
+
+
+def write_manifest(output_dir, entries, formats, seconds):
+    """Grava o `manifest.json` do lote e devolve o caminho"""
+    path = Path(output_dir) / MANIFEST_NAME
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'formats': list(formats),
+        'seconds': round(seconds, 4),
+        'total': len(entries),
+        'failed': sum(map(entry_failed, entries)),
+        'compositions': entries,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera composições de autômatos celulares em lote.")
+    parser.add_argument('specs', nargs='+', help="arquivos .json/.toml ou diretórios com especificações")
+    parser.add_argument('-o', '--output', default='saida', help="diretório de saída (padrão: saida)")
+    parser.add_argument('-f', '--formats', nargs='+', default=list(DEFAULT_FORMATS),
+                        choices=sorted(EXPORTERS), help="formatos exportados (padrão: midi musicxml)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="processos em paralelo (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+
+    try:
+        compositions = load_compositions(args.specs)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Erro ao ler especificações: {e}", file=sys.stderr)
+        return 2
+    if not compositions:
+        print("Nenhuma composição encontrada.", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    formats = list(dict.fromkeys(args.formats))
+    entries = [None] * len(compositions)
+    for done, (idx, entry) in enumerate(iter_render(compositions, args.output, formats, args.workers), start=1):
+        entries[idx] = entry
+        status = entry.get('error') or ', '.join(
+            f"{fmt}: {out.get('error', 'ok')}" for fmt, out in entry['outputs'].items())
+        print(f"[{done}/{len(compositions)}] {entry['id']} ({entry['seconds']:.2f}s) {status}")
+
+    manifest = write_manifest(args.output, entries, formats, time.perf_counter() - start)
+    print(f"Manifesto: {manifest}")
+    return 1 if any(map(entry_failed, entries)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+🗃️ Cache de Resultados de Autômatos Celulares
+Guarda grids já evoluídos, endereçados pelo conteúdo da configuração, para
+que reruns do Streamlit, cliques repetidos em "Gerar CA" e instrumentos
+duplicados com os mesmos parâmetros não recalculem a evolução.
+
+Camadas:
+- memória: LRU limitada por número de entradas e por bytes
+- disco (opcional): um arquivo .npz por chave em `cache_dir`
+
+`LRUCache` é a base compartilhada com o cache de exportação (`ca_exports`).
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ca_engine import RuleSchedule, generate_ca, generate_ca_batch
+
+
+def ca_cache_key(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell):
+    """Hash estável (sha256) dos parâmetros que determinam o grid"""
+    digest = hashlib.sha256()
+    if isinstance(rule_matrix, RuleSchedule):
+        digest.update(b"schedule:" + rule_matrix.fingerprint())
+    else:
+        rule_matrix = np.ascontiguousarray(rule_matrix, dtype=np.int64)
+        digest.update(repr(rule_matrix.shape).encode())
+        digest.update(rule_matrix.tobytes())
+    digest.update(repr((int(generations), int(length), int(num_states),
+                        int(neighborhood_size), int(initial_cell))).encode())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Cache LRU em memória limitado por número de entradas e por bytes, com
+    contadores de uso. Subclasses podem acrescentar uma camada em disco
+    (`_load_from_disk` / `_save_to_disk`). Entradas maiores que
+    `max_entry_bytes` não ficam em memória (só no disco, se houver), para
+    que uma única entrada grande não expulse todas as outras.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, max_entry_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes if max_entry_bytes is None else max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        """Contadores de acerto, falha e remoção"""
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+    def clear(self):
+        """Esvazia a camada em memória (o que estiver em disco é mantido)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key):
+        """Retorna o valor da chave ou None; consulta o disco se necessário"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._load_from_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value)
+            return value
+
+    def put(self, key, value):
+        """Armazena o valor (e o grava em disco, se a subclasse tiver essa camada)"""
+        with self._lock:
+            self._store(key, value)
+        self._save_to_disk(key, value)
+        return value
+
+    def _sizeof(self, value):
+        return value.nbytes
+
+    def _store(self, key, value):
+        if key in self._entries:
+            self._bytes -= self._sizeof(self._entries.pop(key))
+        size = self._sizeof(value)
+        if size > self.max_entry_bytes:
+            return
+        self._entries[key] = value
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._sizeof(evicted)
+            self.evictions += 1
+
+    def _load_from_disk(self, key):
+        return None
+
+    def _save_to_disk(self, key, value):
+        pass
+
+
+class CAResultCache(LRUCache):
+    """Cache LRU de grids com camada opcional em disco e contadores de uso"""
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, cache_dir=None):
+        super().__init__(max_entries, max_bytes)
+        self.cache_dir = os.fspath(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def put(self, key, ca):
+        """Armazena um grid (somente leitura) e o grava em disco se houver cache_dir"""
+        ca = np.asarray(ca)
+        ca.setflags(write=False)
+        return super().put(key, ca)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                ca = data['ca']
+        except (OSError, ValueError, KeyError):
+            return None
+        ca.setflags(write=False)
+        return ca
+
+    def _save_to_disk(self, key, ca):
+        if not self.cache_dir:
+            return
+        # Escrita atômica: grava num arquivo temporário e renomeia
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, ca=ca)
+            os.replace(temp_path, self._disk_path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+
+# Cache padrão do processo (persiste entre reruns do Streamlit)
+CA_CACHE = CAResultCache()
+
+
+def generate_ca_cached(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell,
+                       cache=None):
+    """`generate_ca` com consulta ao cache; o grid retornado é somente leitura"""
+    cache = CA_CACHE if cache is None else cache
+    key = ca_cache_key(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell)
+    ca = cache.get(key)
+    if ca is None:
+        ca = cache.put(key, generate_ca(rule_matrix, generations, length, num_states,
+                                        neighborhood_size, initial_cell))
+    return ca
+
+
+def generate_ca_batch_cached(jobs, cache=None):
+    """`generate_ca_batch` evoluindo em lote apenas os jobs ausentes do cache"""
+    cache = CA_CACHE if cache is None else cache
+    keys = [
+        ca_cache_key(job['rule_matrix'], job['generations'], job['length'], job['num_states'],
+                     job['neighborhood_size'], job['initial_cell'])
+        for job in jobs
+    ]
+    results = [cache.get(key) for key in keys]
+
+    missing = {}
+    for idx, (key, ca) in enumerate(zip(keys, results)):
+        if ca is None:
+            missing.setdefault(key, idx)  # instrumentos duplicados evoluem uma vez só
+
+    generated = generate_ca_batch([jobs[idx] for idx in missing.values()])
+    fresh = {key: cache.put(key, ca) for key, ca in zip(missing, generated)}
+
+    return [ca if ca is not None else fresh[key] for key, ca in zip(keys, results)]
@@ -0,0 +1,364 @@
+"""
+🔬 Motor de Autômatos Celulares
+Funções de evolução compartilhadas pela versão desktop, pela versão web e
+pelos scripts de linha de comando.
+
+O modo padrão calcula cada geração inteira com operações de array do NumPy;
+o modo 'reference' mantém a implementação original, célula por célula, para
+conferência dos resultados.
+
+Os grids usam o menor tipo inteiro sem sinal que comporta `num_states`
+(uint8 para até 256 estados). Para arquivamento, `pack_grid` guarda duas
+células por byte quando há no máximo 16 estados.
+"""
+
+import numpy as np
+
+
+ENGINE_MODES = ("vectorized", "reference")
+
+
+def state_dtype(num_states):
+    """Menor dtype sem sinal capaz de representar os estados 0..num_states-1"""
+    if num_states <= np.iinfo(np.uint8).max + 1:
+        return np.dtype(np.uint8)
+    if num_states <= np.iinfo(np.uint16).max + 1:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+def compact_grid(ca, num_states):
+    """Converte um grid para o dtype compacto (sem cópia se já estiver nele)"""
+    return np.asarray(ca).astype(state_dtype(num_states), copy=False)
+
+
+def pack_grid(ca):
+    """
+    Empacota o grid em 4 bits por célula (duas células por byte), por linha.
+    Exige estados entre 0 e 15. Use `unpack_grid` com o comprimento original.
+    """
+    ca = np.asarray(ca)
+    if ca.size and (ca.min() < 0 or ca.max() > 15):
+        raise ValueError("Empacotamento em 4 bits exige estados entre 0 e 15")
+
+    generations, length = ca.shape
+    padded = np.zeros((generations, length + (length % 2)), dtype=np.uint8)
+    padded[:, :length] = ca
+    return (padded[:, 0::2] << 4) | padded[:, 1::2]
+
+
+def unpack_grid(packed, length, num_states=16):
+    """Desfaz `pack_grid`, devolvendo o grid no dtype compacto de `num_states`"""
+    packed = np.asarray(packed, dtype=np.uint8)
+    ca = np.empty((packed.shape[0], packed.shape[1] * 2), dtype=state_dtype(num_states))
+    ca[:, 0::2] = packed >> 4
+    ca[:, 1::2] = packed & 0x0F
+    return ca[:, :length]
+
+
+# A partir deste raio a soma por janela deslizante supera os deslocamentos
+SLIDING_WINDOW_MIN_RADIUS = 3
+
+
+def _neighbor_sums_roll(row, radii):
+    """Soma por deslocamentos (np.roll): custo proporcional ao raio"""
+    sums = np.zeros(row.shape, dtype=np.int64)
+    for offset in range(1, int(radii.max(initial=0)) + 1):
+        pair = np.roll(row, offset, axis=-1).astype(np.int64) + np.roll(row, -offset, axis=-1)
+        if radii.ndim:
+            pair *= offset <= radii
+        sums += pair
+    return sums
+
+
+def _neighbor_sums_window(row, radii):
+    """
+    Soma por janela deslizante sobre somas acumuladas: custo independente do raio.
+
+    A janela circular de 2r+1 células cobre `full` voltas completas da linha
+    mais `rest` células a partir de (i - r) mod length.
+    """
+    length = row.shape[-1]
+    full, rest = np.divmod(2 * radii + 1, length)
+    doubled = np.concatenate([row, row], axis=-1).astype(np.int64)
+    prefix = np.zeros(row.shape[:-1] + (2 * length + 1,), dtype=np.int64)
+    np.cumsum(doubled, axis=-1, out=prefix[..., 1:])
+
+    start = (np.arange(length) - radii) % length
+    start = np.broadcast_to(start, row.shape)
+    window = (np.take_along_axis(prefix, start + rest, axis=-1)
+              - np.take_along_axis(prefix, start, axis=-1))
+    return full * prefix[..., length:length + 1] + window - row
+
+
+def neighbor_sums(row, neighborhood_size):
+    """
+    Soma dos vizinhos (sem a própria célula) de cada posição, com borda circular.
+
+    `row` pode ser uma linha ou um bloco de linhas (vizinhança no último eixo);
+    nesse caso `neighborhood_size` pode ser um array com um raio por linha.
+    Raios grandes usam a janela deslizante, cujo custo não depende do raio.
+    """
+    radii = np.asarray(neighborhood_size)
+    if radii.max(initial=0) >= SLIDING_WINDOW_MIN_RADIUS:
+        return _neighbor_sums_window(row, radii)
+    return _neighbor_sums_roll(row, radii)
+
+
+class RuleSchedule:
+    """
+    Cronograma de regras: uma pilha de matrizes indexada pela geração.
+
+    `matrices` tem forma (K, S, S) e `starts` diz a partir de qual fase cada
+    matriz vale (crescente, começando em 0). Com `period` a fase é
+    gen % period e o cronograma se repete; sem ele a última matriz vale
+    para sempre. A memória depende só de K, nunca do número de gerações.
+    A matriz da geração `gen` é a que calcula a linha gen a partir da gen-1.
+    """
+
+    def __init__(self, matrices, starts=None, period=None):
+        self.matrices = np.ascontiguousarray(matrices, dtype=np.int64)
+        if self.matrices.ndim != 3 or not len(self.matrices):
+            raise ValueError("O cronograma precisa de uma pilha (K, S, S) com ao menos uma matriz")
+        self.starts = (np.arange(len(self.matrices)) if starts is None
+                       else np.asarray(starts, dtype=np.int64))
+        if (len(self.starts) != len(self.matrices) or self.starts[0] != 0
+                or np.any(np.diff(self.starts) <= 0)):
+            raise ValueError("starts deve ser crescente, começar em 0 e ter uma entrada por matriz")
+        if period is not None and period < 1:
+            raise ValueError("period deve ser pelo menos 1")
+        self.period = period
+        self._dense = bool(np.array_equal(self.starts, np.arange(len(self.starts))))
+        self.matrices.setflags(write=False)
+
+    @classmethod
+    def periodic(cls, matrices):
+        """Alterna as matrizes a cada geração, em ciclo"""
+        return cls(matrices, period=len(matrices))
+
+    @classmethod
+    def piecewise(cls, segments, period=None):
+        """Segmentos [(geração inicial, matriz), ...]; `period` repete o conjunto"""
+        starts, matrices = zip(*sorted(segments, key=lambda segment: segment[0]))
+        return cls(np.stack(matrices), starts, period)
+
+    def __len__(self):
+        return len(self.matrices)
+
+    def phase(self, gen):
+        return gen % self.period if self.period else gen
+
+    def index_for(self, gen):
+        phase = self.phase(gen)
+        if self._dense:
+            return min(phase, len(self.matrices) - 1)
+        return int(np.searchsorted(self.starts, phase, side='right')) - 1
+
+    def matrix_for(self, gen):
+        """Matriz de regras aplicada para produzir a geração `gen`"""
+        return self.matrices[self.index_for(gen)]
+
+    def cycle_phase(self, gen):
+        """
+        Fase da linha `gen` para a detecção de ciclos: duas linhas iguais com a
+        mesma fase têm o mesmo futuro. None enquanto as regras ainda mudam.
+        """
+        if self.period:
+            return gen % self.period
+        return 0 if gen + 1 >= self.starts[-1] else None
+
+    def fingerprint(self):
+        """Bytes que identificam o cronograma (usados pelo cache)"""
+        return b"|".join([self.matrices.tobytes(), repr(self.matrices.shape).encode(),
+                          self.starts.tobytes(), repr(self.period).encode()])
+
+
+def rules_for(rule_matrix, gen):
+    """Matriz de regras para a geração `gen` (matriz fixa ou `RuleSchedule`)"""
+    if isinstance(rule_matrix, RuleSchedule):
+        return rule_matrix.matrix_for(gen)
+    return rule_matrix
+
+
+def step_row(rule_matrix, row, num_states, neighborhood_size):
+    """Calcula a próxima geração a partir de uma linha inteira"""
+    sums = neighbor_sums(row, neighborhood_size)
+    return rule_matrix[row, sums % num_states]
+
+
+def generate_ca_reference(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell):
+    """Implementação original (laços em Python) - usada como referência"""
+    ca = np.zeros((generations, length), dtype=int)
+    ca[0, initial_cell] = 1
+    schedule = rule_matrix
+
+    for gen in range(1, generations):
+        rule_matrix = rules_for(schedule, gen)
+        for i in range(length):
+            neighbor_sum = 0
+            for offset in range(-neighborhood_size, neighborhood_size + 1):
+                if offset != 0:
+                    neighbor_index = (i + offset) % length
+                    neighbor_sum += ca[gen - 1, neighbor_index]
+
+            current_state = ca[gen - 1, i]
+            ca[gen, i] = rule_matrix[current_state, neighbor_sum % num_states]
+
+    return ca
+
+
+def evolve_ca(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell,
+              dtype=None, detect_cycles=True):
+    """
+    Evolução vetorizada com detecção de ciclos.
+
+    Cada linha é registrada num dicionário pelo seu conteúdo em bytes; quando
+    um estado se repete, as gerações restantes são preenchidas repetindo o
+    período encontrado em vez de recalculadas. Retorna (ca, info), onde info
+    traz 'transient' (gerações antes do ciclo), 'period' (ambos None se nenhum
+    ciclo apareceu) e 'computed' (gerações efetivamente calculadas).
+
+    `rule_matrix` pode ser um `RuleSchedule`; nesse caso a linha só conta como
+    repetida se a fase do cronograma também coincidir.
+    """
+    schedule = rule_matrix if isinstance(rule_matrix, RuleSchedule) else None
+    if schedule is None:
+        rule_matrix = np.asarray(rule_matrix)
+    ca = np.zeros((generations, length), dtype=dtype or state_dtype(num_states))
+    ca[0, initial_cell] = 1
+    info = {'transient': None, 'period': None, 'computed': min(generations, 1)}
+
+    def cycle_key(gen):
+        phase = schedule.cycle_phase(gen) if schedule else 0
+        return None if phase is None else (phase, ca[gen].tobytes())
+
+    seen = {} if detect_cycles and generations else None
+    if seen is not None and cycle_key(0) is not None:
+        seen[cycle_key(0)] = 0
+
+    for gen in range(1, generations):
+        ca[gen] = step_row(rules_for(rule_matrix, gen), ca[gen - 1], num_states, neighborhood_size)
+        info['computed'] = gen + 1
+        if seen is None:
+            continue
+
+        key = cycle_key(gen)
+        if key is None:
+            continue
+        first = seen.setdefault(key, gen)
+        if first != gen:
+            period = gen - first
+            info['transient'] = first
+            info['period'] = period
+            remaining = np.arange(gen + 1, generations)
+            ca[gen + 1:] = ca[first + (remaining - first) % period]
+            break
+
+    return ca, info
+
+
+def generate_ca(rule_matrix, generations, length, num_states, neighborhood_size, initial_cell,
+                mode="vectorized", dtype=None, detect_cycles=True):
+    """
+    Gera o autômato celular.
+
+    mode='vectorized' avança uma geração inteira por operação NumPy, guardando
+    o grid no dtype compacto (`state_dtype`) salvo se `dtype` for informado, e
+    encurta a evolução quando ela entra em ciclo (ver `evolve_ca`);
+    mode='reference' usa a implementação original. Ambos produzem os mesmos estados.
+    """
+    if mode == "reference":
+        return generate_ca_reference(rule_matrix, generations, length, num_states,
+                                     neighborhood_size, initial_cell)
+    if mode != "vectorized":
+        raise ValueError(f"Modo de motor desconhecido: {mode!r} (use {ENGINE_MODES})")
+
+    ca, _ = evolve_ca(rule_matrix, generations, length, num_states, neighborhood_size,
+                      initial_cell, dtype=dtype, detect_cycles=detect_cycles)
+    return ca
+
+
+def _stack_rule_matrices(rule_matrices):
+    """Empilha matrizes de regras de tamanhos diferentes num único array 3-D"""
+    size = max(np.shape(rm)[0] for rm in rule_matrices)
+    stacked = np.zeros((len(rule_matrices), size, size), dtype=np.int64)
+    for k, rm in enumerate(rule_matrices):
+        rm = np.asarray(rm)
+        stacked[k, :rm.shape[0], :rm.shape[1]] = rm
+    return stacked
+
+
+def generate_ca_batch(jobs):
+    """
+    Evolui vários autômatos de uma vez (instrumento × geração × célula).
+
+    Cada job é um dicionário com as mesmas chaves da configuração de um
+    instrumento ('generations', 'length', 'num_states', 'neighborhood_size',
+    'initial_cell') mais 'rule_matrix'. Jobs com o mesmo 'length' são avançados
+    juntos, um passo vetorizado por geração; cada um mantém sua própria matriz
+    de regras e vizinhança. Retorna os grids na mesma ordem dos jobs.
+    Jobs com `RuleSchedule` são evoluídos individualmente por `generate_ca`.
+    """
+    results = [None] * len(jobs)
+    groups = {}
+    for idx, job in enumerate(jobs):
+        if isinstance(job['rule_matrix'], RuleSchedule):
+            results[idx] = generate_ca(job['rule_matrix'], job['generations'], job['length'],
+                                       job['num_states'], job['neighborhood_size'], job['initial_cell'])
+            continue
+        groups.setdefault(job['length'], []).append(idx)
+
+    for length, indices in groups.items():
+        group = [jobs[i] for i in indices]
+        generations = max(job['generations'] for job in group)
+        num_states = np.array([job['num_states'] for job in group])[:, None]
+        radii = np.array([job['neighborhood_size'] for job in group])[:, None]
+        rules = _stack_rule_matrices([job['rule_matrix'] for job in group])
+        which = np.arange(len(group))[:, None]
+
+        ca = np.zeros((len(group), generations, length), dtype=state_dtype(int(num_states.max())))
+        for k, job in enumerate(group):
+            ca[k, 0, job['initial_cell']] = 1
+
+        for gen in range(1, generations):
+            rows = ca[:, gen - 1]
+            sums = neighbor_sums(rows, radii)
+            ca[:, gen] = rules[which, rows, sums % num_states]
+
+        # Cópias: uma view manteria o bloco do grupo inteiro vivo enquanto
+        # qualquer um dos grids (por exemplo no cache) estivesse em uso
+        for k, (idx, job) in enumerate(zip(indices, group)):
+            results[idx] = ca[k, :job['generations']].astype(state_dtype(job['num_states']), copy=True)
+
+    return results
+
+
+def iter_ca(rule_matrix, length, num_states, neighborhood_size, initial_cell,
+            generations=None, block_size=1):
+    """
+    Gera o autômato sob demanda, em blocos de até `block_size` gerações.
+
+    Cada bloco é um array (k, length) novo no dtype compacto; só a linha
+    atual fica em memória entre blocos. Com generations=None a evolução
+    não tem fim - o consumidor decide quando parar.
+    """
+    if block_size < 1:
+        raise ValueError("block_size deve ser pelo menos 1")
+
+    if not isinstance(rule_matrix, RuleSchedule):
+        rule_matrix = np.asarray(rule_matrix)
+    dtype = state_dtype(num_states)
+    row = np.zeros(length, dtype=dtype)
+    row[initial_cell] = 1
+    produced = 0
+
+    while generations is None or produced < generations:
+        size = block_size if generations is None else min(block_size, generations - produced)
+        block = np.empty((size, length), dtype=dtype)
+        for k in range(size):
+            if produced + k > 0:
+                row = step_row(rules_for(rule_matrix, produced + k), row, num_states,
+                               neighborhood_size).astype(dtype, copy=False)
+            block[k] = row
+        produced += size
+        yield block
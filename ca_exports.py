@@ -0,0 +1,254 @@
+"""
+📦 Cache de Artefatos de Exportação
+Guarda os arquivos exportados (MusicXML, MIDI, Lilypond, PNG) de cada
+partitura, endereçados por uma impressão digital das entradas da partitura
+(`score_data`), para que reruns do Streamlit, trocas de aba e exportações
+repetidas produzam cada formato no máximo uma vez. Artefatos grandes demais
+para a memória (MusicXML de partituras longas) ficam num diretório
+temporário, relidos do disco em vez de serializados de novo.
+
+`export_all` produz vários formatos ao mesmo tempo num pool de threads (o
+PNG é um subprocesso do Lilypond), com o tempo de cada um e falhas isoladas.
+
+`score_data` é o dicionário montado pelas interfaces: 'title', 'composer',
+'tempo', 'time_signature' e 'parts' no formato de `ca_midi`.
+"""
+
+import atexit
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from ca_cache import LRUCache
+from ca_lilypond import lilypond_code
+from ca_midi import midi_bytes
+from ca_musicxml import musicxml_bytes
+
+
+LILYPOND_TIMEOUT = 30  # segundos
+
+# Extensão do arquivo de cada formato
+FILE_EXTENSIONS = {'musicxml': '.musicxml', 'midi': '.mid', 'lilypond': '.ly', 'png': '.png'}
+
+
+def score_fingerprint(score_data):
+    """Hash estável (sha256) de tudo que determina os arquivos exportados"""
+    digest = hashlib.sha256()
+    digest.update(repr((score_data.get('title'), score_data.get('composer'),
+                        score_data['tempo'], score_data['time_signature'])).encode())
+    for part in score_data['parts']:
+        cells = np.ascontiguousarray(part['ca'])
+        durations = np.ascontiguousarray(part['durations'], dtype=np.float64)
+        digest.update(repr((part.get('name'), part['instrument'], list(part['note_list']),
+                            str(cells.dtype), cells.shape)).encode())
+        digest.update(cells.tobytes())
+        digest.update(durations.tobytes())
+    return digest.hexdigest()
+
+
+class ExportCache(LRUCache):
+    """
+    Cache LRU de artefatos (bytes ou texto) por (impressão digital, formato).
+    Artefatos maiores que `max_entry_bytes` vão para um diretório temporário
+    (até `max_spill_bytes`), lidos de volta do disco em vez de refeitos.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=128 * 1024 * 1024, max_entry_bytes=32 * 1024 * 1024,
+                 max_spill_bytes=2 * 1024 * 1024 * 1024, spill_dir=None):
+        super().__init__(max_entries, max_bytes, max_entry_bytes)
+        self.max_spill_bytes = max_spill_bytes
+        self.spill_dir = os.fspath(spill_dir) if spill_dir else None
+        self._spilled = OrderedDict()  # chave -> (caminho, bytes, é texto)
+        self._spilled_bytes = 0
+
+    def stats(self):
+        """Contadores de acerto, falha e remoção, e o total gravado em disco"""
+        return {**super().stats(), 'spilled': len(self._spilled), 'spilled_bytes': self._spilled_bytes}
+
+    def _sizeof(self, value):
+        return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+    def _spill_path(self, key):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='ca_exports_')
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+        fingerprint, fmt = key
+        return os.path.join(self.spill_dir, f'{fingerprint}.{fmt}')
+
+    def _load_from_disk(self, key):
+        with self._lock:
+            spilled = self._spilled.get(key)
+            if spilled is None:
+                return None
+            self._spilled.move_to_end(key)
+        path, _, is_text = spilled
+        try:
+            data = Path(path).read_bytes()
+        except OSError:
+            return None
+        return data.decode('utf-8') if is_text else data
+
+    def _save_to_disk(self, key, value):
+        data = value.encode('utf-8') if isinstance(value, str) else value
+        if len(data) <= self.max_entry_bytes or len(data) > self.max_spill_bytes:
+            return
+        with self._lock:
+            if key in self._spilled:
+                return
+            path = self._spill_path(key)
+        try:
+            Path(path).write_bytes(data)
+        except OSError:
+            return
+
+        removed = []
+        with self._lock:
+            self._spilled[key] = (path, len(data), isinstance(value, str))
+            self._spilled_bytes += len(data)
+            while self._spilled_bytes > self.max_spill_bytes:
+                _, (old_path, size, _) = self._spilled.popitem(last=False)
+                self._spilled_bytes -= size
+                removed.append(old_path)
+        for old_path in removed:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+# Cache padrão do processo (persiste entre reruns do Streamlit)
+EXPORT_CACHE = ExportCache()
+
+
+def render_lilypond_png(code, timeout=LILYPOND_TIMEOUT):
+    """
+    PNG da primeira página do código Lilypond. Requer o `lilypond` no PATH;
+    levanta FileNotFoundError se não estiver instalado e RuntimeError se a
+    renderização não gerar imagem.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ly_file = os.path.join(tmpdir, 'score.ly')
+        with open(ly_file, 'w', encoding='utf-8') as f:
+            f.write(code)
+
+        result = subprocess.run(
+            ['lilypond', '--png', '-o', tmpdir, ly_file],
+            capture_output=True,
+            timeout=timeout,
+            text=True
+        )
+
+        png_files = sorted(Path(tmpdir).glob('*.png'))
+        if not png_files:
+            raise RuntimeError(f"lilypond não gerou PNG: {result.stderr.strip()[-500:]}")
+        return png_files[0].read_bytes()
+
+
+def _musicxml(score_data, cache):
+    return musicxml_bytes(score_data['parts'], score_data['tempo'], score_data['time_signature'],
+                          score_data.get('title'), score_data.get('composer'))
+
+
+def _midi(score_data, cache):
+    return midi_bytes(score_data['parts'], score_data['tempo'], score_data['time_signature'])
+
+
+def _lilypond(score_data, cache):
+    return lilypond_code(score_data['parts'], score_data['tempo'], score_data['time_signature'],
+                         score_data.get('title'), score_data.get('composer'))
+
+
+def _png(score_data, cache):
+    # Reaproveita o .ly já produzido (ou em produção) para esta partitura
+    return render_lilypond_png(export_artifact(score_data, 'lilypond', cache))
+
+
+# Formato -> função que produz o artefato a partir de (`score_data`, cache)
+EXPORTERS = {
+    'musicxml': _musicxml,
+    'midi': _midi,
+    'lilypond': _lilypond,
+    'png': _png,
+}
+
+
+# Artefatos em produção: quem pede o mesmo artefato ao mesmo tempo espera o primeiro
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def export_artifact(score_data, fmt, cache=None):
+    """
+    Artefato `fmt` da partitura, produzido uma única vez por impressão digital,
+    mesmo quando pedido por várias threads ao mesmo tempo. Usa
+    `score_data['fingerprint']` quando presente. Falhas não são guardadas.
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"formato de exportação desconhecido: {fmt!r}")
+    cache = EXPORT_CACHE if cache is None else cache
+    fingerprint = score_data.get('fingerprint') or score_fingerprint(score_data)
+
+    key = (fingerprint, fmt)
+    with _in_flight_lock:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        pending = _in_flight.get((id(cache), key))
+        owner = pending is None
+        if owner:
+            pending = _in_flight[(id(cache), key)] = Future()
+    if not owner:
+        return pending.result()
+
+    try:
+        value = cache.put(key, EXPORTERS[fmt](score_data, cache))
+        pending.set_result(value)
+        return value
+    except BaseException as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[(id(cache), key)]
+
+
+def _timed_export(score_data, fmt, cache):
+    start = time.perf_counter()
+    try:
+        data, error = export_artifact(score_data, fmt, cache), None
+    except Exception as e:  # uma falha não derruba os outros formatos
+        data, error = None, e
+    return {'data': data, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def iter_exports(score_data, formats=('musicxml', 'midi', 'lilypond'), max_workers=None, cache=None):
+    """
+    Gera (formato, resultado) à medida que cada formato fica pronto, sem
+    esperar os mais lentos. Resultado: {'data', 'seconds', 'error'}, com
+    'data' None e a exceção em 'error' quando o formato falha.
+    """
+    formats = list(dict.fromkeys(formats))
+    if not formats:
+        return
+    if 'fingerprint' not in score_data:
+        score_data = dict(score_data, fingerprint=score_fingerprint(score_data))
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(formats)) as pool:
+        futures = {pool.submit(_timed_export, score_data, fmt, cache): fmt for fmt in formats}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def export_all(score_data, formats=('musicxml', 'midi', 'lilypond'), max_workers=None, cache=None):
+    """`iter_exports` completo: {formato: resultado}, na ordem de `formats`"""
+    results = dict(iter_exports(score_data, formats, max_workers, cache))
+    return {fmt: results[fmt] for fmt in dict.fromkeys(formats)}
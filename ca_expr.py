@@ -0,0 +1,251 @@
+"""
+🧮 Expressões Seguras para a Regra "Matemática"
+Compila a função digitada pelo usuário sem `eval` de código arbitrário:
+a expressão é analisada uma vez (AST), validada contra uma lista branca de
+construções e avaliada de uma só vez sobre as grades de índices do NumPy.
+
+Permitido:
+- variáveis: state, neighbor_sum, num_states
+- números inteiros e reais
+- operadores + - * / // % ** & | ^ e sinal, comparações, and/or/not, "a if c else b"
+- funções: abs, min, max, round, int, floor, ceil, sqrt, exp, log, sin, cos, tan
+
+Células em que a expressão não tem valor (divisão por zero, raiz de número
+negativo, ...) recebem (state + neighbor_sum) % num_states, como antes.
+A aritmética inteira é feita em int64; resultados que não cabem em 64 bits
+levantam ExpressionError em vez de "dar a volta" silenciosamente.
+"""
+
+import ast
+from functools import lru_cache
+
+import numpy as np
+
+
+VARIABLES = ('state', 'neighbor_sum', 'num_states')
+MAX_EXPRESSION_LENGTH = 500
+
+# Diferença mínima entre o resultado int64 e o mesmo cálculo em float64 que
+# indica estouro: sem estouro ela é só o erro de arredondamento do float
+# (< 2**11 perto de 2**63); com estouro é um múltiplo de 2**64
+_OVERFLOW_GAP = 2.0 ** 62
+
+
+class ExpressionError(ValueError):
+    """Expressão matemática inválida ou com construções não permitidas"""
+
+
+def _pow(base, exponent):
+    # Expoente inteiro negativo: o NumPy recusa, o Python devolve float
+    if np.issubdtype(np.result_type(exponent), np.integer) and np.ma.any(np.ma.less(exponent, 0)):
+        base = np.ma.asarray(base, dtype=float)
+    return np.ma.power(base, exponent)
+
+
+def _checked(op, shadow):
+    """
+    Operação inteira que levanta OverflowError se o resultado não couber em
+    int64. `shadow` é o mesmo cálculo em NumPy puro, feito em float64 sobre
+    os dados das células não mascaradas.
+    """
+    def checked(left, right):
+        result = op(left, right)
+        if np.issubdtype(np.result_type(result), np.integer):
+            approx = shadow(np.ma.getdata(left).astype(np.float64), np.ma.getdata(right).astype(np.float64))
+            overflow = ~np.isfinite(approx) | (np.abs(approx - np.ma.getdata(result)) > _OVERFLOW_GAP)
+            if np.any(overflow & ~np.ma.getmaskarray(result)):
+                raise OverflowError("resultado inteiro não cabe em 64 bits")
+        return result
+    return checked
+
+
+def _and(left, right):
+    # Mesma semântica do Python: retorna o primeiro valor falso ou o último
+    return np.ma.where(np.ma.not_equal(left, 0), right, left)
+
+
+def _or(left, right):
+    return np.ma.where(np.ma.not_equal(left, 0), left, right)
+
+
+def _min(*args):
+    result = args[0]
+    for value in args[1:]:
+        result = np.ma.minimum(result, value)
+    return result
+
+
+def _max(*args):
+    result = args[0]
+    for value in args[1:]:
+        result = np.ma.maximum(result, value)
+    return result
+
+
+FUNCTIONS = {
+    'abs': np.ma.abs,
+    'min': _min,
+    'max': _max,
+    'round': np.ma.round,
+    'int': lambda x: np.trunc(x),
+    'floor': np.ma.floor,
+    'ceil': np.ma.ceil,
+    'sqrt': np.ma.sqrt,
+    'exp': np.ma.exp,
+    'log': np.ma.log,
+    'sin': np.ma.sin,
+    'cos': np.ma.cos,
+    'tan': np.ma.tan,
+}
+
+_HELPERS = {
+    '_add': _checked(np.ma.add, np.add),
+    '_sub': _checked(np.ma.subtract, np.subtract),
+    '_mul': _checked(np.ma.multiply, np.multiply),
+    '_div': np.ma.true_divide,
+    '_floordiv': _checked(np.ma.floor_divide, np.floor_divide),
+    '_mod': np.ma.mod,
+    '_pow': _checked(_pow, np.power),
+    '_neg': lambda operand: _HELPERS['_sub'](np.int64(0), operand),
+    '_and': _and,
+    '_or': _or,
+    '_not': np.ma.logical_not,
+    '_where': lambda test, body, orelse: np.ma.where(np.ma.not_equal(test, 0), body, orelse),
+    '_lt': np.ma.less, '_le': np.ma.less_equal,
+    '_gt': np.ma.greater, '_ge': np.ma.greater_equal,
+    '_eq': np.ma.equal, '_ne': np.ma.not_equal,
+}
+
+_BINOP_HELPERS = {ast.Add: '_add', ast.Sub: '_sub', ast.Mult: '_mul', ast.Div: '_div',
+                  ast.FloorDiv: '_floordiv', ast.Mod: '_mod', ast.Pow: '_pow'}
+_NATIVE_BINOPS = (ast.BitAnd, ast.BitOr, ast.BitXor)
+_COMPARE_HELPERS = {ast.Lt: '_lt', ast.LtE: '_le', ast.Gt: '_gt', ast.GtE: '_ge',
+                    ast.Eq: '_eq', ast.NotEq: '_ne'}
+
+
+def _call(name, *args):
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args), keywords=[])
+
+
+class _ExpressionCompiler:
+    """Valida a AST e a reescreve em chamadas às funções vetorizadas"""
+
+    def __init__(self):
+        self.constants = {}
+
+    def visit(self, node):
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"construção não permitida: {type(node).__name__}")
+        return method(node)
+
+    def visit_Expression(self, node):
+        return ast.Expression(body=self.visit(node.body))
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float, bool):
+            raise ExpressionError(f"constante não permitida: {node.value!r}")
+        # Constantes viram escalares NumPy: nada é calculado com inteiros ilimitados
+        name = f"_c{len(self.constants)}"
+        try:
+            self.constants[name] = np.int64(node.value) if type(node.value) is not float else np.float64(node.value)
+        except OverflowError:
+            raise ExpressionError(f"constante grande demais: {node.value}") from None
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def visit_Name(self, node):
+        if node.id not in VARIABLES:
+            raise ExpressionError(f"nome desconhecido: {node.id} (use {', '.join(VARIABLES)})")
+        return ast.Name(id=node.id, ctx=ast.Load())
+
+    def visit_BinOp(self, node):
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, _NATIVE_BINOPS):
+            return ast.BinOp(left=left, op=node.op, right=right)
+        helper = _BINOP_HELPERS.get(type(node.op))
+        if helper is None:
+            raise ExpressionError(f"operador não permitido: {type(node.op).__name__}")
+        return _call(helper, left, right)
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.UAdd):
+            return ast.UnaryOp(op=node.op, operand=operand)
+        if isinstance(node.op, ast.USub):
+            return _call('_neg', operand)
+        if isinstance(node.op, ast.Not):
+            return _call('_not', operand)
+        raise ExpressionError(f"operador não permitido: {type(node.op).__name__}")
+
+    def visit_Compare(self, node):
+        operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        result = None
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            helper = _COMPARE_HELPERS.get(type(op))
+            if helper is None:
+                raise ExpressionError(f"comparação não permitida: {type(op).__name__}")
+            comparison = _call(helper, left, right)
+            result = comparison if result is None else _call('_and', result, comparison)
+        return result
+
+    def visit_BoolOp(self, node):
+        helper = '_and' if isinstance(node.op, ast.And) else '_or'
+        values = [self.visit(v) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = _call(helper, result, value)
+        return result
+
+    def visit_IfExp(self, node):
+        return _call('_where', self.visit(node.test), self.visit(node.body), self.visit(node.orelse))
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ExpressionError(f"função não permitida: {ast.unparse(node.func)}")
+        if node.keywords or not node.args:
+            raise ExpressionError(f"uso inválido de {node.func.id}()")
+        return _call(f"_f_{node.func.id}", *[self.visit(arg) for arg in node.args])
+
+
+class CompiledExpression:
+    """Expressão validada e compilada, avaliável para qualquer num_states"""
+
+    def __init__(self, text, code, constants):
+        self.text = text
+        self._code = code
+        self._namespace = {'__builtins__': {}, **_HELPERS, **constants,
+                           **{f"_f_{name}": fn for name, fn in FUNCTIONS.items()}}
+
+    def rule_matrix(self, num_states):
+        """Avalia a expressão sobre todas as células (estado × soma) de uma vez"""
+        states = np.arange(num_states, dtype=np.int64)
+        namespace = dict(self._namespace,
+                         state=np.ma.asarray(states[:, None]),
+                         neighbor_sum=np.ma.asarray(states[None, :]),
+                         num_states=np.int64(num_states))
+        fallback = np.add.outer(states, states) % num_states
+
+        try:
+            with np.errstate(all='ignore'):
+                values = np.ma.asarray(np.ma.mod(eval(self._code, namespace), num_states))
+                values = np.ma.filled(values.astype(np.float64), np.nan)
+        except (ArithmeticError, TypeError, ValueError) as e:
+            raise ExpressionError(f"erro ao avaliar '{self.text}': {e}") from e
+
+        values = np.broadcast_to(values, fallback.shape)
+        return np.where(np.isfinite(values), values, fallback).astype(np.int64)
+
+
+@lru_cache(maxsize=128)
+def compile_expression(text):
+    """Valida e compila a expressão (resultado memorizado pelo texto)"""
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"expressão longa demais (máximo {MAX_EXPRESSION_LENGTH} caracteres)")
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except (SyntaxError, RecursionError, ValueError) as e:
+        raise ExpressionError(f"sintaxe inválida em '{text}': {getattr(e, 'msg', e)}") from None
+
+    compiler = _ExpressionCompiler()
+    body = ast.fix_missing_locations(compiler.visit(tree))
+    return CompiledExpression(text, compile(body, '<regra matemática>', 'eval'), compiler.constants)
@@ -0,0 +1,164 @@
+"""
+🎵 Exportação Lilypond Direta
+Gera o código .ly direto dos grids do CA, sem partitura music21: cada
+estado vira um token de altura pré-calculado ("cis'", "r", ...) e cada
+duração distinta da parte vira um token de figura ("4", "2.", "2~ 8"), então
+o texto da parte sai de uma indexação NumPy numa tabela estado × duração.
+
+As partes usam o mesmo formato de `ca_midi` ('ca', 'note_list', 'durations',
+'instrument') e, opcionalmente, 'name'. As notas e pausas que atravessam a
+barra de compasso são divididas pelo próprio Lilypond
+(Completion_heads_engraver / Completion_rest_engraver).
+"""
+
+import io
+import re
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+from ca_midi import instrument_info, pitch_to_midi
+
+
+LILYPOND_VERSION = '2.24.0'
+NOTES_PER_LINE = 8
+
+# Figuras em semínimas, da maior para a menor (com ponto quando aplicável)
+_FIGURES = sorted(
+    [(Fraction(4, 2 ** k) * Fraction(3, 2), f'{2 ** k}.') for k in range(7)]
+    + [(Fraction(4, 2 ** k), f'{2 ** k}') for k in range(7)],
+    reverse=True,
+)
+
+_ACCIDENTALS = {'#': 'is', '-': 'es'}
+_PITCH_PATTERN = re.compile(r'([A-G])([#-]*)(-?\d+)$')
+
+# Clave de fá quando a altura média da parte fica abaixo do dó central
+_BASS_CLEF_BELOW = 60
+
+
+def pitch_token(name):
+    """Altura no formato music21 em notação Lilypond ('C#4' -> "cis'", 'B-2' -> 'bes,')"""
+    match = _PITCH_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"nota inválida: {name!r}")
+    step, accidentals, octave = match.groups()
+    octave = int(octave)
+    token = step.lower() + ''.join(_ACCIDENTALS[a] for a in accidentals)
+    if octave >= 4:
+        return token + "'" * (octave - 3)
+    return token + ',' * (3 - octave)
+
+
+@lru_cache(maxsize=256)
+def duration_tokens(quarter_length):
+    """
+    Figuras Lilypond que somam `quarter_length` (ex.: 2.5 -> ('2', '8')).
+    Durações sem soma exata de figuras (quiálteras etc.) viram uma semínima
+    escalada ('4*1/3').
+    """
+    length = Fraction(quarter_length).limit_denominator(10080)
+    if (length / _FIGURES[-1][0]).denominator != 1:
+        return (f'4*{length.numerator}/{length.denominator}',)
+
+    tokens = []
+    remaining = length
+    while remaining > 0:
+        size, token = next(figure for figure in _FIGURES if figure[0] <= remaining)
+        tokens.append(token)
+        remaining -= size
+    return tuple(tokens)
+
+
+def _event_token(pitch, figures):
+    """Nota ligada (ou pausas seguidas) cobrindo todas as figuras"""
+    if pitch == 'r':
+        return ' '.join('r' + figure for figure in figures)
+    return '~ '.join(pitch + figure for figure in figures)
+
+
+def part_tokens(ca, note_list, durations):
+    """
+    Token de cada célula: tabela estado × duração distinta montada uma vez e
+    indexada com os estados e os índices das durações.
+    """
+    cells = np.asarray(ca).ravel()
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) != len(cells):
+        raise ValueError(f"{len(durations)} durações para {len(cells)} células")
+    if not cells.size:
+        return np.empty(0, dtype=object)
+
+    num_states = int(cells.max()) + 1
+    pitches = ['r'] + [pitch_token(note_list[(state - 1) % len(note_list)]) for state in range(1, num_states)]
+    lengths, duration_index = np.unique(durations, return_inverse=True)
+    figures = [duration_tokens(length) for length in lengths.tolist()]
+
+    table = np.array([[_event_token(p, f) for f in figures] for p in pitches], dtype=object)
+    return table[cells, duration_index.ravel()]
+
+
+def _clef(ca, note_list):
+    cells = np.asarray(ca).ravel()
+    active = cells[cells > 0].astype(np.int64)
+    if not active.size:
+        return 'treble'
+    midi_table = np.array([pitch_to_midi(name) for name in note_list])
+    return 'bass' if midi_table[(active - 1) % len(note_list)].mean() < _BASS_CLEF_BELOW else 'treble'
+
+
+def _quote(text):
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _write_part(write, part, tempo_bpm, time_signature):
+    name = part.get('name') or instrument_info(part['instrument'])[0]
+    write(f'    \\new Staff \\with {{\n'
+          f'      instrumentName = {_quote(name)}\n'
+          f'    }} \\new Voice \\with {{\n'
+          f'      \\remove "Note_heads_engraver"\n'
+          f'      \\consists "Completion_heads_engraver"\n'
+          f'      \\remove "Rest_engraver"\n'
+          f'      \\consists "Completion_rest_engraver"\n'
+          f'    }} {{\n'
+          f'      \\clef {_clef(part["ca"], part["note_list"])}\n'
+          f'      \\time {time_signature}\n'
+          f'      \\tempo 4 = {tempo_bpm}\n\n')
+
+    tokens = part_tokens(part['ca'], part['note_list'], part['durations']).tolist()
+    for start in range(0, len(tokens), NOTES_PER_LINE):
+        write('      ' + ' '.join(tokens[start:start + NOTES_PER_LINE]) + '\n')
+    write('      \\bar "|."\n    }\n')
+
+
+def write_lilypond(fp, parts, tempo_bpm=120, time_signature='4/4', title=None, composer=None):
+    """
+    Escreve a partitura em `fp`: caminho de arquivo ou objeto de texto com
+    `write` (ex.: StringIO). Nenhum objeto music21 é criado.
+    """
+    if isinstance(fp, (str, bytes)) or hasattr(fp, '__fspath__'):
+        with open(fp, 'w', encoding='utf-8') as f:
+            write_lilypond(f, parts, tempo_bpm, time_signature, title, composer)
+        return fp
+
+    write = fp.write
+    write(f'\\version "{LILYPOND_VERSION}"\n\n\\header {{\n')
+    if title:
+        write(f'  title = {_quote(title)}\n')
+    if composer:
+        write(f'  composer = {_quote(composer)}\n')
+    write('  tagline = "Gerado por Compositor CA"\n}\n\n\\score {\n  <<\n')
+
+    for part in parts:
+        _write_part(write, part, tempo_bpm, time_signature)
+
+    write('  >>\n  \\layout { }\n  \\midi { }\n}\n')
+    return fp
+
+
+def lilypond_code(parts, tempo_bpm=120, time_signature='4/4', title=None, composer=None):
+    """`write_lilypond` num StringIO, devolvendo o texto"""
+    buffer = io.StringIO()
+    write_lilypond(buffer, parts, tempo_bpm, time_signature, title, composer)
+    return buffer.getvalue()
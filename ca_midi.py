@@ -0,0 +1,252 @@
+"""
+🎹 Exportação MIDI Direta
+Escreve arquivos MIDI (SMF tipo 1) a partir dos grids do CA, sem montar um
+objeto music21 por nota. Os eventos de cada trilha são calculados com NumPy
+e serializados num único buffer por trilha.
+
+Cada parte é um dicionário com:
+- 'ca': grid do autômato (gerações × células)
+- 'note_list': notas dos estados 1..n (ex.: ['C4', 'C#4', ...])
+- 'durations': duração de cada célula em semínimas (ver `ca_music.plan_durations`)
+- 'instrument': nome da classe music21 (ex.: 'Flute')
+
+No modo streaming (`ca_music.stream_part`) 'ca' e 'durations' dão lugar a
+'blocks', uma função que devolve um iterador novo de blocos (estados,
+durações), e a 'quarter_length', a duração total da parte. Cada bloco é
+convertido e gravado antes do próximo, então a memória não cresce com o
+tamanho da peça.
+
+O arquivo gerado é o mesmo de `score.write('midi')` para as partituras
+montadas pelas interfaces (MetronomeMark e TimeSignature no início de cada
+parte, partes adicionadas com `Score.append`):
+- trilha 0 (regente): andamento e compasso no início de cada parte; como
+  `Score.append` enfileira as partes, cada uma começa onde a anterior termina
+- um canal por programa MIDI, na ordem em que aparecem (o canal 10 é pulado)
+- NOTE_ON com velocidade 90, NOTE_OFF com velocidade 0
+- uma semínima de espera antes de END_OF_TRACK
+"""
+
+import io
+import re
+import struct
+from functools import lru_cache
+
+import numpy as np
+from music21 import instrument
+
+
+TICKS_PER_QUARTER = 10080  # mesmo padrão do music21
+DEFAULT_VELOCITY = 90
+MIDI_CHANNELS = list(range(1, 10)) + list(range(11, 17))  # canal 10 é percussão
+
+_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+_PITCH_PATTERN = re.compile(r'([A-G])([#-]*)(-?\d+)$')
+
+_NOTE_OFF, _NOTE_ON, _PROGRAM_CHANGE, _PITCH_BEND = 0x80, 0x90, 0xC0, 0xE0
+_TRACK_NAME, _END_OF_TRACK, _SET_TEMPO, _TIME_SIGNATURE = 0x03, 0x2F, 0x51, 0x58
+
+
+def pitch_to_midi(name):
+    """Número MIDI de uma nota no formato music21 ('C#4' -> 61, 'B-3' -> 58)"""
+    match = _PITCH_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"nota inválida: {name!r}")
+    step, accidentals, octave = match.groups()
+    alter = accidentals.count('#') - accidentals.count('-')
+    return _PITCH_CLASSES[step] + alter + 12 * (int(octave) + 1)
+
+
+@lru_cache(maxsize=None)
+def instrument_info(instrument_name):
+    """(nome da trilha, programa MIDI) da classe de instrumento music21"""
+    inst = getattr(instrument, instrument_name)()
+    return inst.bestName() or '', inst.midiProgram
+
+
+def _var_len(value):
+    """Quantidade de tamanho variável (VLQ) de um único inteiro"""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _encode_events(deltas, payload):
+    """
+    Serializa n eventos de tamanho fixo: VLQ de cada delta seguido da linha
+    correspondente de `payload` (n × k bytes), tudo de uma vez.
+    """
+    deltas = np.asarray(deltas, dtype=np.int64)
+    if not len(deltas):
+        return b''
+
+    num_groups = max(1, (int(deltas.max()).bit_length() + 6) // 7)
+    shifts = 7 * np.arange(num_groups - 1, -1, -1)
+    vlq = ((deltas[:, None] >> shifts) & 0x7F).astype(np.uint8)
+    vlq[:, :-1] |= 0x80
+
+    # Grupos significativos de cada delta (sempre ao menos o último)
+    sizes = np.ones(len(deltas), dtype=np.int64)
+    for groups in range(1, num_groups):
+        sizes += deltas >= (1 << (7 * groups))
+    keep_vlq = np.arange(num_groups)[None, :] >= (num_groups - sizes)[:, None]
+
+    rows = np.concatenate([vlq, payload.astype(np.uint8)], axis=1)
+    keep = np.concatenate([keep_vlq, np.ones(payload.shape, dtype=bool)], axis=1)
+    return rows[keep].tobytes()
+
+
+def _meta(event_type, data, delta=0):
+    return _var_len(delta) + bytes([0xFF, event_type]) + _var_len(len(data)) + data
+
+
+def _chunk(data):
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+
+def _end_of_track():
+    return _meta(_END_OF_TRACK, b'', delta=TICKS_PER_QUARTER)
+
+
+def _ticks(quarter_lengths):
+    return np.rint(np.asarray(quarter_lengths, dtype=np.float64) * TICKS_PER_QUARTER).astype(np.int64)
+
+
+def part_blocks(part):
+    """
+    Blocos (estados, durações) 1D da parte: o grid inteiro de uma vez ou, no
+    modo streaming, os blocos de `part['blocks']()`.
+    """
+    blocks = part['blocks']() if 'blocks' in part else [(part['ca'], part['durations'])]
+    for ca, durations in blocks:
+        cells = np.asarray(ca).ravel()
+        durations = np.asarray(durations, dtype=np.float64)
+        if len(durations) != len(cells):
+            raise ValueError(f"{len(durations)} durações para {len(cells)} células")
+        yield cells, durations
+
+
+def part_quarter_length(part):
+    """Duração total da parte em semínimas"""
+    if 'blocks' in part:
+        return float(part['quarter_length'])
+    return float(np.sum(part['durations']))
+
+
+def part_note_events(ca, note_list, durations, offset=0.0):
+    """
+    (início, fim, nota MIDI) de cada célula ativa, em ticks, com a primeira
+    célula começando em `offset` semínimas. Pausas não geram eventos, só
+    avançam o tempo.
+    """
+    cells = np.asarray(ca).ravel()
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) != len(cells):
+        raise ValueError(f"{len(durations)} durações para {len(cells)} células")
+
+    starts = np.cumsum(np.concatenate(([offset], durations)))[:-1]
+    active = cells > 0
+    on = _ticks(starts[active])
+    off = on + _ticks(durations[active])
+
+    pitch_table = np.array([pitch_to_midi(n) for n in note_list], dtype=np.int64)
+    pitches = pitch_table[(cells[active].astype(np.int64) - 1) % len(note_list)]
+    return on, off, pitches
+
+
+def _write_note_track(fp, part, channel):
+    """
+    Grava a trilha da parte bloco a bloco; o tamanho do chunk é preenchido
+    no fim, então `fp` precisa de `seek`.
+    """
+    track_name, program = instrument_info(part['instrument'])
+    status = channel - 1
+    program = program or 0
+
+    chunk_start = fp.tell()
+    fp.write(b'MTrk\0\0\0\0')
+    # Nome, programa, zera o pitch bend e o programa do instrumento da parte
+    fp.write(_meta(_TRACK_NAME, track_name.encode('utf-8', 'ignore'))
+             + bytes([0, _PROGRAM_CHANGE | status, program])
+             + bytes([0, _PITCH_BEND | status, 0, 64])
+             + bytes([0, _PROGRAM_CHANGE | status, program]))
+
+    position, last_tick = 0.0, 0
+    for cells, durations in part_blocks(part):
+        on, off, pitches = part_note_events(cells, part['note_list'], durations, position)
+        position = float(np.cumsum(np.concatenate(([position], durations)))[-1])
+        if not len(on):
+            continue
+        times = np.column_stack([on, off]).ravel()
+        deltas = np.diff(times, prepend=last_tick)
+        last_tick = int(times[-1])
+
+        payload = np.empty((len(times), 3), dtype=np.int64)
+        payload[0::2, 0] = _NOTE_ON | status
+        payload[1::2, 0] = _NOTE_OFF | status
+        payload[:, 1] = np.repeat(pitches, 2)
+        payload[0::2, 2] = DEFAULT_VELOCITY
+        payload[1::2, 2] = 0
+        fp.write(_encode_events(deltas, payload))
+    fp.write(_end_of_track())
+
+    chunk_end = fp.tell()
+    fp.seek(chunk_start + 4)
+    fp.write(struct.pack('>I', chunk_end - chunk_start - 8))
+    fp.seek(chunk_end)
+
+
+def _conductor_track(parts, tempo_bpm, time_signature):
+    numerator, denominator = map(int, time_signature.split('/'))
+    tempo_data = int(round(60_000_000 / tempo_bpm)).to_bytes(3, 'big')
+    meter_data = bytes([numerator, int(np.log2(denominator)), 24, 8])
+
+    # Cada parte começa onde a anterior termina (Score.append)
+    part_lengths = [part_quarter_length(part) for part in parts]
+    part_starts = _ticks(np.concatenate(([0.0], np.cumsum(part_lengths)[:-1])))
+
+    data = bytearray()
+    previous = 0
+    for start in part_starts:
+        data += _meta(_SET_TEMPO, tempo_data, delta=int(start) - previous)
+        data += _meta(_TIME_SIGNATURE, meter_data)
+        previous = int(start)
+    return _chunk(bytes(data) + _end_of_track())
+
+
+def assign_channels(parts):
+    """Canal MIDI de cada parte: um por programa, na ordem de aparição"""
+    channel_by_program = {}
+    for part in parts:
+        program = instrument_info(part['instrument'])[1]
+        if program not in channel_by_program:
+            index = len(channel_by_program)
+            # Como o music21, reserva um canal livre; o excedente vai para o canal 1
+            channel_by_program[program] = MIDI_CHANNELS[index] if index < len(MIDI_CHANNELS) - 1 else 1
+    return [channel_by_program[instrument_info(part['instrument'])[1]] for part in parts]
+
+
+def write_midi(fp, parts, tempo_bpm=120, time_signature='4/4'):
+    """
+    Grava o arquivo MIDI, com uma trilha por parte, em `fp`: caminho de
+    arquivo ou objeto binário com `write` e `seek` (ex.: BytesIO).
+    """
+    if isinstance(fp, (str, bytes)) or hasattr(fp, '__fspath__'):
+        with open(fp, 'wb') as f:
+            write_midi(f, parts, tempo_bpm, time_signature)
+        return fp
+
+    fp.write(b'MThd' + struct.pack('>IHHH', 6, 1, len(parts) + 1, TICKS_PER_QUARTER))
+    fp.write(_conductor_track(parts, tempo_bpm, time_signature))
+    for part, channel in zip(parts, assign_channels(parts)):
+        _write_note_track(fp, part, channel)
+    return fp
+
+
+def midi_bytes(parts, tempo_bpm=120, time_signature='4/4'):
+    """`write_midi` num BytesIO, devolvendo os bytes"""
+    buffer = io.BytesIO()
+    write_midi(buffer, parts, tempo_bpm, time_signature)
+    return buffer.getvalue()
@@ -0,0 +1,318 @@
+"""
+🎼 Conversão Musical de Autômatos Celulares
+Funções de conversão CA → partes (estados + durações) compartilhadas pelas
+duas interfaces e pelos scripts sem interface gráfica.
+
+No modo streaming (`stream_part`) as gerações são consumidas à medida que
+`ca_engine.iter_ca` as produz e `ca_midi`/`ca_musicxml` gravam bloco a
+bloco, sem nunca materializar o grid completo.
+"""
+
+import copy
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from functools import lru_cache
+from itertools import islice
+from math import lcm
+
+import numpy as np
+
+from ca_engine import iter_ca
+from ca_midi import pitch_to_midi
+
+
+NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Durações válidas para modo aleatório (sem quiálteras)
+RANDOM_DURATIONS = [0.5, 1.0, 2.0, 4.0]  # Colcheia, Semínima, Mínima, Semibreve
+RHYTHM_BARS_PER_BLOCK = 256  # compassos sorteados de cada vez no modo aleatório
+STREAM_BLOCK_GENERATIONS = 256  # gerações convertidas de cada vez no modo streaming
+
+# Agrupamento de células repetidas: None, por geração ou na sequência inteira
+MERGE_MODES = (None, 'row', 'stream')
+
+# Abaixo disso o custo de iniciar os processos supera o ganho
+PARALLEL_MIN_CELLS = 500_000
+
+
+def beats_per_measure(time_signature):
+    """Duração do compasso em semínimas (quarter notes)"""
+    numerator, denominator = map(int, time_signature.split('/'))
+    return numerator * (4.0 / denominator)
+
+
+def resolve_seed(seed=None):
+    """
+    Semente do ritmo: a informada ou, se vazia, uma nova (para poder repetir).
+    Levanta ValueError se não for um inteiro não negativo.
+    """
+    if seed is None or seed == '':
+        return int(np.random.SeedSequence().generate_state(1)[0])
+    try:
+        value = int(seed) if not isinstance(seed, float) or seed.is_integer() else -1
+    except (TypeError, ValueError):
+        value = -1
+    if value < 0:
+        raise ValueError(f"semente inválida: {seed!r} (use um inteiro não negativo)")
+    return value
+
+
+def rhythm_generators(seed, num_parts):
+    """Um `numpy.random.Generator` independente por parte, derivado da semente"""
+    return [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(num_parts)]
+
+
+@lru_cache(maxsize=32)
+def _rhythm_table(time_signature):
+    """
+    Cadeia do ritmo aleatório em unidades inteiras do compasso: quantas
+    durações cabem em cada posição e a posição seguinte para cada escolha.
+    Posições onde nada cabe voltam ao início, como na regra original.
+    """
+    numerator, denominator = map(int, time_signature.split('/'))
+    measure = Fraction(4 * numerator, denominator)
+    values = sorted(Fraction(d) for d in RANDOM_DURATIONS)
+    unit = lcm(measure.denominator, *(v.denominator for v in values))
+    measure_units = int(measure * unit)
+    value_units = np.array([int(v * unit) for v in values], dtype=np.int64)
+
+    positions = np.arange(measure_units)
+    counts = np.searchsorted(value_units, measure_units - positions, side='right')
+    if counts[0] == 0:
+        counts[0] = len(values)  # compasso menor que a menor duração
+
+    next_position = positions[:, None] + value_units[None, :]
+    next_position[next_position >= measure_units] = 0
+    next_position[counts[next_position] == 0] = 0
+
+    max_steps = -(-measure_units // int(value_units[0]))
+    return counts, next_position, np.array([float(v) for v in values]), max_steps
+
+
+def _random_bars(rng, time_signature, num_bars=RHYTHM_BARS_PER_BLOCK):
+    """
+    Durações de `num_bars` compassos sorteados em paralelo: cada passo escolhe
+    a próxima duração de todos os compassos ao mesmo tempo, só entre as que
+    cabem no que resta de cada um.
+    """
+    counts, next_position, values, max_steps = _rhythm_table(time_signature)
+    draws = rng.random((max_steps, num_bars))
+
+    chosen = np.zeros((max_steps, num_bars))
+    position = np.zeros(num_bars, dtype=np.int64)
+    active = np.ones(num_bars, dtype=bool)
+    for step in range(max_steps):
+        index = (draws[step] * counts[position]).astype(np.int64)
+        chosen[step] = np.where(active, values[index], 0.0)
+        position = next_position[position, index]
+        active &= position != 0
+
+    # Compasso por compasso, na ordem
+    bars = chosen.T
+    return bars[bars > 0]
+
+
+def iter_durations(rhythmic_value, randomize_rhythm, time_signature='4/4', rng=None):
+    """
+    Sequência infinita de durações, uma por célula. No modo aleatório cada
+    duração cabe no que resta do compasso; `rng` é um `numpy.random.Generator`
+    ou uma semente. Começa igual a `plan_durations` com o mesmo gerador.
+    """
+    if not randomize_rhythm:
+        while True:
+            yield rhythmic_value
+
+    rng = np.random.default_rng(rng)
+    while True:
+        yield from _random_bars(rng, time_signature).tolist()
+
+
+def plan_durations(num_cells, rhythmic_value, randomize_rhythm, time_signature='4/4', rng=None):
+    """
+    Durações (em semínimas) de `num_cells` células consecutivas, como array.
+    Mesma semente, mesmo ritmo (ver `iter_durations`).
+    """
+    if not randomize_rhythm:
+        return np.full(num_cells, rhythmic_value, dtype=np.float64)
+
+    rng = np.random.default_rng(rng)
+    blocks, total = [], 0
+    while total < num_cells:
+        blocks.append(_random_bars(rng, time_signature))
+        total += len(blocks[-1])
+    return np.concatenate(blocks)[:num_cells] if blocks else np.empty(0)
+
+
+def total_duration(num_cells, rhythmic_value, randomize_rhythm, time_signature='4/4', rng=None):
+    """Soma das durações de `plan_durations`, sorteadas por blocos sem guardar o array"""
+    if not randomize_rhythm:
+        return float(num_cells * rhythmic_value)
+
+    rng = np.random.default_rng(rng)
+    total, remaining = 0.0, num_cells
+    while remaining > 0:
+        bars = _random_bars(rng, time_signature)[:remaining]
+        total += float(bars.sum())
+        remaining -= len(bars)
+    return total
+
+
+def merge_runs(ca, durations, mode='row'):
+    """
+    Agrupa células consecutivas de mesmo estado numa só nota (ou pausa),
+    somando as durações. Modos (ver `MERGE_MODES`): 'row' agrupa dentro de
+    cada geração, 'stream' também através das gerações e None não agrupa.
+    Devolve (estados, durações) em 1D; as ligaduras nas barras de compasso
+    ficam a cargo dos exportadores.
+    """
+    ca = np.asarray(ca)
+    cells = ca.ravel()
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) != len(cells):
+        raise ValueError(f"{len(durations)} durações para {len(cells)} células")
+    if mode not in MERGE_MODES:
+        raise ValueError(f"modo de agrupamento inválido: {mode!r}")
+    if mode is None or not cells.size:
+        return cells, durations
+
+    starts = np.empty(cells.size, dtype=bool)
+    starts[0] = True
+    starts[1:] = cells[1:] != cells[:-1]
+    if mode == 'row' and ca.ndim > 1:
+        starts[::ca.shape[-1]] = True
+
+    run_starts = np.flatnonzero(starts)
+    return cells[run_starts], np.add.reduceat(durations, run_starts)
+
+
+def reorder_notes(initial_note, octaves, octave_mode=None):
+    """Reordena as notas começando pela nota inicial"""
+    start_index = NOTES.index(initial_note)
+    reordered = NOTES[start_index:] + NOTES[:start_index]
+    return [f"{name}{octaves[i % len(octaves)]}" for i, name in enumerate(reordered)]
+
+
+def part_stats(cells, note_list, durations):
+    """
+    Resumo de uma parte calculado direto dos estados: notas, pausas, duração total (semínimas), histograma de alturas
+    (nome -> ocorrências, na ordem de `note_list`) e extremos da tessitura.
+    """
+    cells = np.asarray(cells).ravel()
+    active = cells[cells > 0]
+
+    # Estados que caem na mesma nota (módulo len(note_list)) somam juntos
+    by_note = np.bincount((active.astype(np.int64) - 1) % len(note_list), minlength=len(note_list))
+    histogram = {}
+    for name, count in zip(note_list, by_note.tolist()):
+        if count:
+            histogram[name] = histogram.get(name, 0) + count
+
+    used = sorted(histogram, key=pitch_to_midi)
+    return {
+        'notes': int(active.size),
+        'rests': int(cells.size - active.size),
+        'duration': float(np.sum(durations)),
+        'pitch_histogram': histogram,
+        'lowest': used[0] if used else None,
+        'highest': used[-1] if used else None,
+    }
+
+
+def prepare_part(job):
+    """
+    Conversão de uma parte: planeja as durações e agrupa as células.
+    `job` traz 'ca',
+    'note_list', 'instrument', 'name', 'rhythmic_value', 'randomize_rhythm',
+    'time_signature', 'rng' e, opcionalmente, 'merge_runs'. Devolve a parte
+    no formato de `ca_midi`/`ca_musicxml`, com o resumo de `part_stats` em
+    'stats'.
+    """
+    ca = job['ca']
+    durations = plan_durations(np.size(ca), job['rhythmic_value'], job['randomize_rhythm'],
+                               job['time_signature'], rng=job['rng'])
+    cells, durations = merge_runs(ca, durations, job.get('merge_runs'))
+    return {
+        'ca': cells,
+        'note_list': job['note_list'],
+        'durations': durations,
+        'instrument': job['instrument'],
+        'name': job['name'],
+        'stats': part_stats(cells, job['note_list'], durations),
+    }
+
+
+def iter_prepared_parts(jobs, max_workers=None):
+    """
+    `prepare_part` de cada job, na ordem dos jobs. Partituras grandes usam um
+    pool de processos, uma parte por tarefa; cada parte é entregue assim que
+    ela e as anteriores ficam prontas.
+    """
+    jobs = list(jobs)
+    total_cells = sum(np.size(job['ca']) for job in jobs)
+    if max_workers == 1 or len(jobs) < 2 or total_cells < PARALLEL_MIN_CELLS:
+        yield from map(prepare_part, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        yield from pool.map(prepare_part, jobs)
+
+
+def iter_part_blocks(rows, rhythmic_value, randomize_rhythm, time_signature='4/4', rng=None, merge=None):
+    """
+    Converte blocos de gerações (por exemplo de `ca_engine.iter_ca`) em
+    pares (estados, durações) 1D, um bloco por vez. Com o mesmo `rng` o
+    resultado é o de `plan_durations` + `merge_runs` sobre o grid inteiro;
+    no modo 'stream' a última nota de cada bloco espera o próximo, onde
+    pode continuar.
+    """
+    durations = iter_durations(rhythmic_value, randomize_rhythm, time_signature, rng)
+    carry = None
+    for block in rows:
+        block = np.atleast_2d(block)
+        block_durations = np.fromiter(islice(durations, block.size), dtype=np.float64, count=block.size)
+        if merge != 'stream':
+            yield merge_runs(block, block_durations, merge)
+            continue
+
+        cells = block.ravel()
+        if carry is not None:
+            cells = np.concatenate((carry[0], cells))
+            block_durations = np.concatenate((carry[1], block_durations))
+        cells, block_durations = merge_runs(cells, block_durations, 'stream')
+        carry = cells[-1:], block_durations[-1:]
+        yield cells[:-1], block_durations[:-1]
+
+    if carry is not None:
+        yield carry
+
+
+def stream_part(job):
+    """
+    Parte do modo streaming: como `prepare_part`, mas em vez de 'ca' o job
+    traz os parâmetros de `ca_engine.iter_ca` ('rule_matrix', 'generations',
+    'length', 'num_states', 'neighborhood_size', 'initial_cell' e,
+    opcionalmente, 'block_size'). A parte devolvida tem 'blocks', que
+    recalcula o CA do início a cada chamada (com o mesmo ritmo), em vez do
+    grid; `ca_midi` e `ca_musicxml` a gravam bloco a bloco.
+    """
+    generations, length = job['generations'], job['length']
+    if generations is None:
+        raise ValueError("o modo streaming precisa de um número de gerações")
+    rng = job['rng']
+    if not isinstance(rng, np.random.Generator):
+        rng = np.random.default_rng(rng)
+    rhythm = (job['rhythmic_value'], job['randomize_rhythm'], job['time_signature'])
+
+    def blocks():
+        rows = iter_ca(job['rule_matrix'], length, job['num_states'], job['neighborhood_size'],
+                       job['initial_cell'], generations, job.get('block_size', STREAM_BLOCK_GENERATIONS))
+        return iter_part_blocks(rows, *rhythm, rng=copy.deepcopy(rng), merge=job.get('merge_runs'))
+
+    return {
+        'blocks': blocks,
+        'duration_values': RANDOM_DURATIONS if job['randomize_rhythm'] else [job['rhythmic_value']],
+        'quarter_length': total_duration(generations * length, *rhythm, rng=copy.deepcopy(rng)),
+        'note_list': job['note_list'],
+        'instrument': job['instrument'],
+        'name': job['name'],
+    }
@@ -0,0 +1,278 @@
+"""
+📄 Exportação MusicXML Incremental
+Serializa a partitura direto dos grids do CA, compasso por compasso, sem
+montar a árvore music21 nem a árvore XML completas: cada compasso é gerado e
+escrito no arquivo (ou BytesIO) antes do próximo, então o pico de memória é
+proporcional a um compasso.
+
+As partes usam o mesmo formato de `ca_midi` ('ca', 'note_list', 'durations',
+'instrument') e, opcionalmente, 'name' com o nome exibido na partitura.
+Partes do modo streaming ('blocks', ver `ca_midi`) trazem também
+'duration_values', as durações possíveis antes do agrupamento, para
+calcular as divisões sem ver a parte inteira.
+Notas que atravessam a barra de compasso são divididas e ligadas (tie), e
+durações sem figura única viram figuras ligadas (ex.: 2.5 = mínima + colcheia).
+"""
+
+import io
+import re
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from ca_midi import assign_channels, instrument_info, part_blocks
+
+
+MUSICXML_DOCTYPE = ('<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+                    '"http://www.musicxml.org/dtds/partwise.dtd">')
+
+# Figuras em semínimas (com ponto quando aplicável), da maior para a menor
+NOTE_TYPES = [
+    (Fraction(4), 'whole'), (Fraction(2), 'half'), (Fraction(1), 'quarter'),
+    (Fraction(1, 2), 'eighth'), (Fraction(1, 4), '16th'), (Fraction(1, 8), '32nd'),
+    (Fraction(1, 16), '64th'),
+]
+_FIGURES = sorted(
+    [(length * 3 / 2, name, 1) for length, name in NOTE_TYPES] + [(length, name, 0) for length, name in NOTE_TYPES],
+    reverse=True,
+)
+
+_ACCIDENTALS = {-2: 'flat-flat', -1: 'flat', 0: 'natural', 1: 'sharp', 2: 'double-sharp'}
+_PITCH_PATTERN = re.compile(r'([A-G])([#-]*)(-?\d+)$')
+
+
+def _quarter_fraction(value):
+    return Fraction(float(value)).limit_denominator(10080)
+
+
+def divisions_for(durations, time_signature):
+    """
+    Menor número de divisões por semínima que representa todas as durações
+    (e as somas delas, como as notas agrupadas por `merge_runs`)
+    """
+    lengths = {_quarter_fraction(d) for d in np.unique(np.asarray(durations, dtype=np.float64))}
+    lengths.add(_measure_quarters(time_signature))
+    return lcm(*(length.denominator for length in lengths))
+
+
+def _measure_quarters(time_signature):
+    numerator, denominator = map(int, time_signature.split('/'))
+    return Fraction(4 * numerator, denominator)
+
+
+@lru_cache(maxsize=256)
+def _figures(length_divisions, divisions, allow_whole=True):
+    """
+    Decompõe uma duração (em divisões) em figuras (divisões, tipo, pontos).
+    Pausas que não ocupam o compasso inteiro não usam semibreve, que os
+    leitores interpretam como pausa de compasso.
+    """
+    figures = []
+    remaining = Fraction(length_divisions, divisions)
+    while remaining > 0:
+        for length, name, dots in _FIGURES:
+            if name == 'whole' and not allow_whole:
+                continue
+            if length <= remaining and (length * divisions).denominator == 1:
+                figures.append((int(length * divisions), name, dots))
+                remaining -= length
+                break
+        else:
+            # Sem figura exata (quiálteras etc.): resto vai sem <type>
+            figures.append((int(remaining * divisions), None, 0))
+            break
+    return tuple(figures)
+
+
+def _parse_pitch(name):
+    match = _PITCH_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"nota inválida: {name!r}")
+    step, accidentals, octave = match.groups()
+    return step, accidentals.count('#') - accidentals.count('-'), int(octave)
+
+
+def _iter_cells(part):
+    for cells, durations in part_blocks(part):
+        yield from zip(cells.tolist(), durations.tolist())
+
+
+def _iter_measures(part, measure_divisions, divisions):
+    """
+    Gera as listas de eventos de cada compasso, um compasso por vez.
+    Evento: (estado, divisões, tipo, pontos, liga_fim, liga_início); estado 0 é pausa.
+    """
+    measure, position = [], 0
+    for cell, duration_value in _iter_cells(part):
+        remaining = int(_quarter_fraction(duration_value) * divisions)
+        first = True
+        while remaining > 0:
+            take = min(remaining, measure_divisions - position)
+            figures = _figures(take, divisions, cell > 0 or take == measure_divisions)
+            for idx, (length, name, dots) in enumerate(figures):
+                last = remaining == take and idx == len(figures) - 1
+                tied = cell > 0
+                measure.append((cell, length, name, dots, tied and not first, tied and not last))
+                first = False
+            remaining -= take
+            position += take
+            if position == measure_divisions:
+                yield measure
+                measure, position = [], 0
+
+    if measure:
+        yield measure
+
+
+def _note_xml(event, pitch_table, accidental_state, measure_divisions):
+    cell, length, name, dots, tie_stop, tie_start = event
+    out = ['      <note>\n']
+
+    if cell == 0:
+        if length == measure_divisions and name is not None:
+            out.append('        <rest measure="yes"/>\n')
+            name = None
+        else:
+            out.append('        <rest/>\n')
+        accidental = None
+    else:
+        step, alter, octave = pitch_table[(cell - 1) % len(pitch_table)]
+        out.append(f'        <pitch>\n          <step>{step}</step>\n')
+        if alter:
+            out.append(f'          <alter>{alter}</alter>\n')
+        out.append(f'          <octave>{octave}</octave>\n        </pitch>\n')
+        # Acidente visível quando muda em relação ao que já vale no compasso
+        key = (step, octave)
+        accidental = None
+        if not tie_stop and accidental_state.get(key, 0) != alter:
+            accidental = _ACCIDENTALS.get(alter)
+        accidental_state[key] = alter
+
+    out.append(f'        <duration>{length}</duration>\n')
+    if tie_stop:
+        out.append('        <tie type="stop"/>\n')
+    if tie_start:
+        out.append('        <tie type="start"/>\n')
+    out.append('        <voice>1</voice>\n')
+    if name is not None:
+        out.append(f'        <type>{name}</type>\n')
+    out.extend('        <dot/>\n' for _ in range(dots))
+    if accidental:
+        out.append(f'        <accidental>{accidental}</accidental>\n')
+    if tie_stop or tie_start:
+        out.append('        <notations>\n')
+        if tie_stop:
+            out.append('          <tied type="stop"/>\n')
+        if tie_start:
+            out.append('          <tied type="start"/>\n')
+        out.append('        </notations>\n')
+    out.append('      </note>\n')
+    return ''.join(out)
+
+
+def _first_measure_header(divisions, time_signature, tempo_bpm):
+    beats, beat_type = time_signature.split('/')
+    return (
+        '      <attributes>\n'
+        f'        <divisions>{divisions}</divisions>\n'
+        '        <key>\n          <fifths>0</fifths>\n        </key>\n'
+        f'        <time>\n          <beats>{beats}</beats>\n          <beat-type>{beat_type}</beat-type>\n        </time>\n'
+        '        <clef>\n          <sign>G</sign>\n          <line>2</line>\n        </clef>\n'
+        '      </attributes>\n'
+        '      <direction placement="above">\n'
+        '        <direction-type>\n'
+        f'          <metronome>\n            <beat-unit>quarter</beat-unit>\n            <per-minute>{tempo_bpm}</per-minute>\n          </metronome>\n'
+        '        </direction-type>\n'
+        f'        <sound tempo="{tempo_bpm}"/>\n'
+        '      </direction>\n'
+    )
+
+
+def _part_list(parts):
+    out = ['  <part-list>\n']
+    for idx, (part, channel) in enumerate(zip(parts, assign_channels(parts)), start=1):
+        track_name, program = instrument_info(part['instrument'])
+        part_name = part.get('name') or track_name
+        out.append(
+            f'    <score-part id="P{idx}">\n'
+            f'      <part-name>{escape(part_name)}</part-name>\n'
+            f'      <score-instrument id="P{idx}-I1">\n'
+            f'        <instrument-name>{escape(track_name)}</instrument-name>\n'
+            '      </score-instrument>\n'
+            f'      <midi-instrument id="P{idx}-I1">\n'
+            f'        <midi-channel>{channel}</midi-channel>\n'
+            f'        <midi-program>{(program or 0) + 1}</midi-program>\n'
+            '      </midi-instrument>\n'
+            '    </score-part>\n'
+        )
+    out.append('  </part-list>\n')
+    return ''.join(out)
+
+
+def _write_part(write, idx, part, tempo_bpm, time_signature):
+    divisions = divisions_for(part['duration_values'] if 'blocks' in part else part['durations'],
+                              time_signature)
+    measure_divisions = int(_measure_quarters(time_signature) * divisions)
+    pitch_table = [_parse_pitch(n) for n in part['note_list']]
+
+    write(f'  <part id="P{idx}">\n')
+    measures = _iter_measures(part, measure_divisions, divisions)
+    current = next(measures, [])
+    number = 1
+    while True:
+        following = next(measures, None)
+        out = [f'    <measure number="{number}">\n']
+        if number == 1:
+            out.append(_first_measure_header(divisions, time_signature, tempo_bpm))
+        accidental_state = {}
+        out.extend(_note_xml(event, pitch_table, accidental_state, measure_divisions) for event in current)
+        if following is None:
+            out.append('      <barline location="right">\n        <bar-style>light-heavy</bar-style>\n      </barline>\n')
+        out.append('    </measure>\n')
+        write(''.join(out))
+
+        if following is None:
+            break
+        current, number = following, number + 1
+    write('  </part>\n')
+
+
+def write_musicxml(fp, parts, tempo_bpm=120, time_signature='4/4', title=None, composer=None):
+    """
+    Escreve a partitura em MusicXML 4.0 (partwise) em `fp`: caminho de
+    arquivo ou objeto binário com `write` (ex.: BytesIO).
+    """
+    if isinstance(fp, (str, bytes)) or hasattr(fp, '__fspath__'):
+        with open(fp, 'wb') as f:
+            write_musicxml(f, parts, tempo_bpm, time_signature, title, composer)
+        return fp
+
+    def write(text):
+        fp.write(text.encode('utf-8'))
+
+    write(f'<?xml version="1.0" encoding="UTF-8"?>\n{MUSICXML_DOCTYPE}\n<score-partwise version="4.0">\n')
+    if title:
+        write(f'  <work>\n    <work-title>{escape(title)}</work-title>\n  </work>\n'
+              f'  <movement-title>{escape(title)}</movement-title>\n')
+    write('  <identification>\n')
+    if composer:
+        write(f'    <creator type="composer">{escape(composer)}</creator>\n')
+    write('    <encoding>\n      <software>CA Music Composer</software>\n    </encoding>\n'
+          '  </identification>\n')
+    write(_part_list(parts))
+
+    for idx, part in enumerate(parts, start=1):
+        _write_part(write, idx, part, tempo_bpm, time_signature)
+
+    write('</score-partwise>\n')
+    return fp
+
+
+def musicxml_bytes(parts, tempo_bpm=120, time_signature='4/4', title=None, composer=None):
+    """`write_musicxml` num BytesIO, devolvendo os bytes"""
+    buffer = io.BytesIO()
+    write_musicxml(buffer, parts, tempo_bpm, time_signature, title, composer)
+    return buffer.getvalue()
@@ -0,0 +1,194 @@
+"""
+💾 Arquivo de Projeto (.caproj)
+Salva e reabre uma sessão inteira: as configurações dos instrumentos e as
+configurações globais vão em `project.json`, e cada grid do CA vai num
+membro `.npy` sem compressão dentro de um único zip.
+
+Os membros `.npy` são gravados alinhados a 64 bytes dentro do arquivo, então
+reabrir o projeto não regenera nem copia os grids: cada `ca_result` é uma
+visão somente leitura (`np.frombuffer`) sobre o arquivo mapeado em memória
+(mmap) ou sobre os bytes recebidos (upload do Streamlit). O custo de abrir
+não depende do tamanho dos grids.
+
+No Windows um arquivo mapeado não pode ser substituído enquanto o mapa
+existir, e os grids abertos o mantêm vivo: salvar por cima do projeto aberto
+falharia. Lá o arquivo é lido para a memória (uma leitura, ainda sem copiar
+cada grid) em vez de mapeado.
+"""
+
+import io
+import json
+import mmap
+import os
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+
+PROJECT_FORMAT = 'ca-music-project'
+PROJECT_VERSION = 1
+PROJECT_EXTENSION = '.caproj'
+MANIFEST_MEMBER = 'project.json'
+
+# Início dos dados de cada membro .npy alinhado a este número de bytes
+NPY_ALIGNMENT = 64
+
+# Abrir caminhos com mmap (no Windows o mapa impediria salvar por cima)
+MAP_PROJECT_FILES = os.name != 'nt'
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')  # cabeçalho local de um membro zip (30 bytes)
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_PADDING_EXTRA_ID = 0xD935  # campo "extra" de alinhamento (o mesmo do zipalign)
+_NPY_HEADER_MAX = 65536 + 16
+_NPY_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"valor não serializável no projeto: {type(value).__name__}")
+
+
+def _aligned_extra(offset, member):
+    """Campo extra que faz os dados do membro começarem alinhados"""
+    data_start = offset + _LOCAL_HEADER.size + len(member.encode('utf-8')) + 4
+    padding = -data_start % NPY_ALIGNMENT
+    return struct.pack('<HH', _PADDING_EXTRA_ID, padding) + b'\0' * padding
+
+
+def _npy_bytes(grid):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.ascontiguousarray(grid), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def save_project(fp, instrument_configs, settings=None):
+    """
+    Grava o projeto em `fp` (caminho ou arquivo binário com `seek`).
+    `instrument_configs` é o dicionário das interfaces ({nome: configuração});
+    o 'ca_result' de cada instrumento, se houver, vira um membro .npy.
+    `settings` guarda as configurações globais (título, tempo, semente...).
+    Num caminho, grava num arquivo temporário e o substitui no fim: os grids
+    podem ser visões mapeadas do próprio arquivo que está sendo sobrescrito.
+    """
+    if isinstance(fp, (str, os.PathLike)):
+        tmp_path = f'{os.fspath(fp)}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                save_project(f, instrument_configs, settings)
+            os.replace(tmp_path, fp)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return fp
+
+    instruments, grids = [], []
+    for idx, (name, config) in enumerate(instrument_configs.items()):
+        ca_result = config.get('ca_result')
+        member = None
+        if ca_result is not None:
+            member = f'grids/{idx:03d}.npy'
+            grids.append((member, ca_result))
+        instruments.append({
+            'name': name,
+            'config': {k: v for k, v in config.items() if k != 'ca_result'},
+            'grid': member,
+        })
+
+    manifest = {
+        'format': PROJECT_FORMAT,
+        'version': PROJECT_VERSION,
+        'settings': dict(settings or {}),
+        'instruments': instruments,
+    }
+
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(fp, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr(zipfile.ZipInfo(MANIFEST_MEMBER, date_time),
+                    json.dumps(manifest, ensure_ascii=False, indent=2, default=_json_default))
+        for member, grid in grids:
+            info = zipfile.ZipInfo(member, date_time)
+            info.extra = _aligned_extra(zf.fp.tell(), member)
+            zf.writestr(info, _npy_bytes(grid))
+    return fp
+
+
+def project_bytes(instrument_configs, settings=None):
+    """`save_project` num BytesIO, devolvendo os bytes (para download)"""
+    buffer = io.BytesIO()
+    save_project(buffer, instrument_configs, settings)
+    return buffer.getvalue()
+
+
+def _member_array(zf, info, buf):
+    """Grid do membro como visão sobre `buf`, sem cópia (lido normalmente se comprimido)"""
+    start = info.header_offset
+    if info.compress_type != zipfile.ZIP_STORED:
+        with zf.open(info) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+    header = _LOCAL_HEADER.unpack_from(buf, start)
+    if header[0] != _LOCAL_SIGNATURE:
+        raise ValueError(f"membro corrompido no projeto: {info.filename}")
+    data_start = start + _LOCAL_HEADER.size + header[-2] + header[-1]
+
+    npy = io.BytesIO(buf[data_start:data_start + min(info.file_size, _NPY_HEADER_MAX)])
+    version = np.lib.format.read_magic(npy)
+    if version not in _NPY_HEADER_READERS:
+        with zf.open(info) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+    shape, fortran_order, dtype = _NPY_HEADER_READERS[version](npy)
+    if dtype.hasobject:
+        raise ValueError(f"grid com objetos Python no projeto: {info.filename}")
+
+    count = int(np.prod(shape))
+    array = np.frombuffer(buf, dtype=dtype, count=count, offset=data_start + npy.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def _project_buffer(source):
+    """(buffer, arquivo para o zipfile) de um caminho, bytes ou arquivo aberto"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if MAP_PROJECT_FILES:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), source
+            source = f.read()
+    if hasattr(source, 'getvalue'):
+        source = source.getvalue()
+    elif hasattr(source, 'read'):
+        source = source.read()
+    buf = bytes(source)
+    return buf, io.BytesIO(buf)
+
+
+def load_project(source):
+    """
+    Abre um projeto de um caminho (mapeado em memória, exceto no Windows),
+    de bytes ou de um arquivo aberto (ex.: upload do Streamlit). Devolve
+    (instrument_configs, settings); os 'ca_result' são somente leitura.
+    Levanta ValueError se `source` não for um projeto válido.
+    """
+    try:
+        buf, archive = _project_buffer(source)
+        with zipfile.ZipFile(archive) as zf:
+            manifest = json.loads(zf.read(MANIFEST_MEMBER).decode('utf-8'))
+            if manifest.get('format') != PROJECT_FORMAT:
+                raise ValueError("o arquivo não é um projeto do Compositor CA")
+            if manifest.get('version', 0) > PROJECT_VERSION:
+                raise ValueError(f"versão de projeto não suportada: {manifest['version']}")
+
+            instrument_configs = {}
+            for inst in manifest['instruments']:
+                grid = inst.get('grid')
+                ca_result = _member_array(zf, zf.getinfo(grid), buf) if grid else None
+                instrument_configs[inst['name']] = {**inst['config'], 'ca_result': ca_result}
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"projeto inválido: {e}") from e
+    return instrument_configs, manifest.get('settings', {})
@@ -0,0 +1,128 @@
+"""
+🔢 Regras de Transição dos Autômatos Celulares
+Construção vetorizada das matrizes de regras, compartilhada pelas duas
+interfaces. A matriz é indexada por [estado atual, soma dos vizinhos % num_states].
+
+O tipo de regra pode ser informado pelo número usado na versão desktop
+(1-5) ou pelo nome usado na versão web ("Determinística", "Thresholds", ...).
+Matrizes determinísticas são memorizadas por (tipo, num_states, parâmetros)
+e retornadas como somente leitura. "Time-Sensitive" com `time_rate` diferente
+de zero devolve um `RuleSchedule` que muda a cada geração. Uma função "Matemática" inválida levanta
+`ca_expr.ExpressionError` (subclasse de ValueError).
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from ca_engine import RuleSchedule
+from ca_expr import compile_expression
+
+
+RULE_TYPES = {
+    1: "Determinística",
+    2: "Thresholds",
+    3: "Aleatória",
+    4: "Matemática",
+    5: "Time-Sensitive",
+}
+RULE_TYPE_IDS = {name: rule_id for rule_id, name in RULE_TYPES.items()}
+
+DEFAULT_MATH_FUNCTION = "(state + neighbor_sum) % num_states"
+
+
+def rule_type_id(rule_type):
+    """Normaliza o tipo de regra (número ou nome) para o número 1-5 (None se desconhecido)"""
+    if rule_type in RULE_TYPES:
+        return rule_type
+    return RULE_TYPE_IDS.get(rule_type)
+
+
+def _index_grids(num_states):
+    """Grades (estado, soma dos vizinhos) prontas para broadcasting"""
+    states = np.arange(num_states)
+    return states[:, None], states[None, :]
+
+
+def _deterministic(num_states, shift=0):
+    state, neighbor_sum = _index_grids(num_states)
+    return (state + neighbor_sum + shift) % num_states
+
+
+def _thresholds(num_states, thresholds):
+    state, neighbor_sum = _index_grids(num_states)
+    # Índice do primeiro threshold maior que a soma (len(thresholds) se nenhum)
+    t_index = np.searchsorted(np.asarray(thresholds), neighbor_sum, side='right')
+    rule_matrix = (state + t_index + 1) % num_states
+    return np.where(t_index < len(thresholds), rule_matrix, 0)
+
+
+def _math_rule(num_states, math_func_str):
+    # Expressão compilada com segurança (ver ca_expr); erros são levantados
+    # como ExpressionError para a expressão inteira
+    return compile_expression(math_func_str).rule_matrix(num_states)
+
+
+@lru_cache(maxsize=256)
+def _cached_rule_matrix(rule_id, num_states, params):
+    params = dict(params)
+    if rule_id == 1:  # Determinística
+        rule_matrix = _deterministic(num_states)
+    elif rule_id == 2:  # Thresholds
+        rule_matrix = _thresholds(num_states, sorted(params.get('thresholds', (3, 6))))
+    elif rule_id == 4:  # Matemática
+        rule_matrix = _math_rule(num_states, params.get('math_function') or DEFAULT_MATH_FUNCTION)
+    elif rule_id == 5:  # Time-sensitive
+        rule_matrix = _deterministic(num_states, params.get('time_step', 1))
+    else:
+        rule_matrix = np.zeros((num_states, num_states), dtype=int)
+
+    rule_matrix = np.ascontiguousarray(rule_matrix, dtype=np.int64)
+    rule_matrix.setflags(write=False)
+    return rule_matrix
+
+
+def time_sensitive_schedule(num_states, time_step=1, time_rate=1):
+    """
+    Regra Time-Sensitive variando no tempo: na geração g vale
+    (state + neighbor_sum + time_step + time_rate * g) % num_states.
+    O deslocamento se repete a cada num_states / mdc(time_rate, num_states)
+    gerações, então só esse período é guardado.
+    """
+    period = num_states // np.gcd(int(time_rate), int(num_states))
+    state, neighbor_sum = _index_grids(num_states)
+    shifts = (time_step + time_rate * np.arange(period))[:, None, None]
+    return RuleSchedule.periodic((state + neighbor_sum + shifts) % num_states)
+
+
+@lru_cache(maxsize=64)
+def _cached_time_schedule(num_states, time_step, time_rate):
+    return time_sensitive_schedule(num_states, time_step, time_rate)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def generate_rule_matrix(num_states, rule_type, rng=None, **kwargs):
+    """
+    Gera a matriz de regras baseada no tipo selecionado (número ou nome).
+    Para Time-Sensitive com `time_rate` devolve um `RuleSchedule`. A regra
+    Aleatória usa `rng` (`numpy.random.Generator`) quando informado.
+    """
+    rule_id = rule_type_id(rule_type)
+
+    if rule_id == 3:  # Aleatória - nunca memorizada
+        if rng is not None:
+            return rng.integers(0, num_states, size=(num_states, num_states))
+        return np.random.randint(0, num_states, size=(num_states, num_states), dtype=int)
+
+    if rule_id == 5 and kwargs.get('time_rate'):  # Time-sensitive variando por geração
+        return _cached_time_schedule(int(num_states), int(kwargs.get('time_step', 1)),
+                                     int(kwargs['time_rate']))
+
+    return _cached_rule_matrix(rule_id, int(num_states), _freeze(kwargs))
@@ -32,29 +32,24 @@ INSTRUMENT_TYPE = 'Flute'
 
 def generate_rule_matrix_deterministic(num_states):
     """Generate a deterministic rule matrix."""
-    return np.array([
-        [(i + j) % num_states for j in range(num_states)] 
-        for i in range(num_states)
-    ])
+    states = np.arange(num_states)
+    return np.add.outer(states, states) % num_states
 
 
 def generate_ca(rule_matrix, generations, length, num_states, 
                 neighborhood_size, initial_cell):
-    """Generate cellular automaton evolution."""
+    """Generate cellular automaton evolution (one NumPy step per generation)."""
     ca = np.zeros((generations, length), dtype=int)
     ca[0, initial_cell] = 1
-    
+
     for gen in range(1, generations):
-        for i in range(length):
-            neighbor_sum = 0
-            for offset in range(-neighborhood_size, neighborhood_size + 1):
-                if offset != 0:
-                    neighbor_index = (i + offset) % length
-                    neighbor_sum += ca[gen - 1, neighbor_index]
-            
-            current_state = ca[gen - 1, i]
-            ca[gen, i] = rule_matrix[current_state, neighbor_sum % num_states]
-    
+        row = ca[gen - 1]
+        neighbor_sum = np.zeros(length, dtype=int)
+        for offset in range(1, neighborhood_size + 1):
+            neighbor_sum += np.roll(row, offset) + np.roll(row, -offset)
+
+        ca[gen] = rule_matrix[row, neighbor_sum % num_states]
+
     return ca
 
 
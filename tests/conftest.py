@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos ca_* ficam na raiz do repositório
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
@@ -0,0 +1,57 @@
+# Testes: expressões da regra "Matemática" (ca_expr)
+import numpy as np
+import pytest
+
+from ca_expr import ExpressionError, compile_expression
+from ca_rules import generate_rule_matrix
+
+
+@pytest.mark.parametrize("expression", [
+    "(state + neighbor_sum) % num_states",
+    "state * neighbor_sum + 3",
+    "state ** 2 - neighbor_sum",
+    "2 ** 62 + (2 ** 62 - 1)",
+])
+def test_integer_results_match_python(expression):
+    num_states = 7
+    expected = np.array([[eval(expression, {}, {'state': s, 'neighbor_sum': n, 'num_states': num_states})
+                          % num_states for n in range(num_states)] for s in range(num_states)])
+    np.testing.assert_array_equal(compile_expression(expression).rule_matrix(num_states), expected)
+
+
+def test_undefined_cells_use_fallback():
+    matrix = generate_rule_matrix(5, 4, math_function="state // neighbor_sum")
+    assert list(matrix[:, 0]) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("expression", [
+    "(state + 2) ** 5000",
+    "9 ** 9 ** 9 ** 9",
+    "state * 9223372036854775807",
+    "2 ** 62 + 2 ** 62",
+    "-(0 - 9223372036854775807 - 1)",
+])
+def test_integer_overflow_raises(expression):
+    with pytest.raises(ExpressionError):
+        generate_rule_matrix(7, 4, math_function=expression)
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "().__class__",
+    "state.real",
+    "[1, 2]",
+    "lambda: 1",
+    "x",
+    "open('f')",
+    "'a' * 3",
+    "abs(state, key=1)",
+    "state @ neighbor_sum",
+    "state << 2",
+    "state in (1, 2)",
+    "1 +",
+    "state + " * 200 + "1",
+])
+def test_expressions_outside_whitelist_are_rejected(expression):
+    with pytest.raises(ExpressionError):
+        compile_expression(expression)